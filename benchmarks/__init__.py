@@ -0,0 +1,3 @@
+"""
+Benchmarks for UPiano, run them with: python -m benchmarks
+"""
@@ -0,0 +1,64 @@
+"""
+Run the benchmarks, writing the results as JSON.
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+from importlib import import_module
+from importlib.metadata import PackageNotFoundError
+from importlib.metadata import version
+
+MODULES = [
+    "benchmarks.bench_render",
+    "benchmarks.bench_notes",
+    "benchmarks.bench_ui",
+    "benchmarks.bench_footprint",
+    "benchmarks.bench_softsynth",
+    "benchmarks.bench_note_player",
+]
+
+
+def _version(package):
+    try:
+        return version(package)
+    except PackageNotFoundError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-o", "--output", help="JSON file, defaults to stdout")
+    parser.add_argument(
+        "-k", "--filter", default="", help="only run benchmarks with this in the name"
+    )
+    args = parser.parse_args()
+
+    results = {}
+    for module_name in MODULES:
+        for bench in import_module(module_name).BENCHMARKS:
+            name = bench.__name__.removeprefix("bench_")
+            if args.filter not in name:
+                continue
+            print("Running {}...".format(name), file=sys.stderr)
+            results[name] = bench()
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "upiano": _version("upiano"),
+        "textual": _version("textual"),
+        "results": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+import timeit
+
+
+class StubSynth:
+    """
+    Stands in for MidiSynth, so that benchmarks run without audio.
+    """
+
+    sample_rate = 44100
+
+    def __init__(self):
+        self.calls = 0
+
+    def note_on(self, note_value, channel=0, velocity=100):
+        self.calls += 1
+
+    def note_off(self, note_value, channel=0):
+        self.calls += 1
+
+    def notes_on(self, notes, velocity=100):
+        self.calls += 1
+
+    def notes_off(self, notes):
+        self.calls += 1
+
+    def send_message(self, status, data1, data2=0):
+        self.calls += 1
+
+    def send_messages(self, messages):
+        self.calls += 1
+
+    def control_change(self, control, value, channel=0):
+        self.calls += 1
+
+    def select_midi_program(self, program_id, channel=0, bank_id=0):
+        self.calls += 1
+
+    def set_sustain(self, value, channel=0):
+        self.calls += 1
+
+    def set_volume(self, value, channel=0):
+        self.calls += 1
+
+    def set_chorus(self, value, channel=0):
+        self.calls += 1
+
+    def set_reverb(self, value, channel=0):
+        self.calls += 1
+
+
+def ns_per_call(func, repeat=5):
+    """
+    Best time of a call to `func`, in nanoseconds.
+    """
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number * 1e9
+
+
+def install_stub_synth():
+    """
+    Make the app use a StubSynth, as `run_app` would do with a MidiSynth.
+    """
+    from upiano import app
+    from upiano.controllers import ControllerUpdates
+    from upiano.note_pipeline import NotePipeline
+
+    app.synthesizer = StubSynth()
+    app.note_pipeline = NotePipeline(app.synthesizer, app.PLAY_SETTINGS)
+    app.controllers = ControllerUpdates(app.synthesizer)
+    return app
@@ -0,0 +1,117 @@
+"""
+CPU and memory footprint of the full UI and of the headless mode.
+
+Each mode runs in a fresh interpreter, so that the peak memory measured is
+its own: it starts up, plays the same keys, then idles for a second. The UI
+runs with Textual's headless driver, which composes and renders the screen
+like in a terminal, only without writing the output.
+"""
+import asyncio
+import json
+import resource
+import subprocess
+import sys
+import time
+
+KEY_PRESSES = 200
+IDLE_SECONDS = 1.0
+KEYS = "awsedftgyhujkolp"
+
+
+def _cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _max_rss_mb():
+    # Linux keeps ru_maxrss across fork and exec, so it would be the peak of
+    # the benchmark runner: the process's own is in VmHWM
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / (1 << 10)
+    except OSError:
+        pass
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on MacOS
+    return max_rss / (1 << 20 if sys.platform == "darwin" else 1 << 10)
+
+
+async def _run_ui(measure):
+    from benchmarks._common import install_stub_synth
+
+    app = install_stub_synth().MyApp()
+    async with app.run_test(size=(120, 40)) as pilot:
+        await pilot.pause()
+        measure("startup")
+        for i in range(KEY_PRESSES):
+            await pilot.press(KEYS[i % len(KEYS)])
+        await pilot.pause()
+        measure("keys")
+        await asyncio.sleep(IDLE_SECONDS)
+        measure("idle")
+
+
+async def _run_headless(measure):
+    from benchmarks._common import StubSynth
+    from upiano.controllers import ControllerUpdates
+    from upiano.headless import HeadlessPiano
+    from upiano.note_pipeline import NotePipeline
+
+    synth = StubSynth()
+    piano = HeadlessPiano(synth, NotePipeline(synth), ControllerUpdates(synth))
+    measure("startup")
+    for i in range(KEY_PRESSES):
+        piano.feed(KEYS[i % len(KEYS)])
+        await asyncio.sleep(0)
+    piano.key_release.release_all()
+    measure("keys")
+    await asyncio.sleep(IDLE_SECONDS)
+    measure("idle")
+
+
+def _measure_mode(mode):
+    """
+    Run a mode in this process, returning its footprint.
+    """
+    results = {}
+    last = {"cpu": _cpu_seconds(), "wall": time.perf_counter()}
+
+    def measure(phase):
+        cpu = _cpu_seconds()
+        wall = time.perf_counter()
+        results[phase + "_cpu_ms"] = (cpu - last["cpu"]) * 1000
+        if phase == "idle":
+            results["idle_cpu_percent"] = (
+                (cpu - last["cpu"]) / (wall - last["wall"]) * 100
+            )
+        last.update(cpu=cpu, wall=wall)
+
+    run = _run_ui if mode == "ui" else _run_headless
+    asyncio.run(run(measure))
+    results["max_rss_mb"] = _max_rss_mb()
+    results["modules_loaded"] = len(sys.modules)
+    return results
+
+
+def bench_footprint():
+    results = {}
+    for mode in ("ui", "headless"):
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_footprint", mode],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        results[mode] = json.loads(output)
+    return results
+
+
+BENCHMARKS = [
+    bench_footprint,
+]
+
+
+if __name__ == "__main__":
+    print(json.dumps(_measure_mode(sys.argv[1])))
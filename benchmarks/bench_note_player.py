@@ -0,0 +1,95 @@
+"""
+Notes per second the legacy front end keeps up with: spawning a sox
+process per note, against a single audio output mixing the notes.
+
+Spawning is measured with sox's `play` (skipped if it's not installed):
+the notes are started back to back, and the CPU time they take includes
+the sox processes, until they are done. The persistent output is measured
+without a player: in each period of audio, more and more notes are
+started, up to the rate where rendering a second of audio takes longer
+than a second.
+"""
+import resource
+import shutil
+import time
+
+from upiano.note_player import NotePlayer
+from upiano.note_player import spawn_note
+from upiano.softsynth import SoftSynth
+
+SPAWNED_NOTES = 50
+NOTES = ["C", "D", "E", "F", "G", "A", "B", "C5", "D5", "E5"]
+SAMPLE_RATE = 48000
+PERIOD_SIZE = 512
+NOTES_PER_PERIOD = [1, 2, 4, 8, 16, 32, 64]
+
+
+def _cpu_seconds(who):
+    usage = resource.getrusage(who)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _cpu_seconds_all():
+    return _cpu_seconds(resource.RUSAGE_SELF) + _cpu_seconds(resource.RUSAGE_CHILDREN)
+
+
+def bench_note_player_spawn():
+    if shutil.which("play") is None:
+        return {"skipped": "sox's play not found"}
+    cpu = _cpu_seconds_all()
+    start = time.perf_counter()
+    processes = [
+        spawn_note(NOTES[i % len(NOTES)], duration=0.5) for i in range(SPAWNED_NOTES)
+    ]
+    call_seconds = time.perf_counter() - start
+    for process in processes:
+        process.wait()
+    cpu_per_note = (_cpu_seconds_all() - cpu) / SPAWNED_NOTES
+    return {
+        "call_ms": call_seconds / SPAWNED_NOTES * 1000,
+        "cpu_ms_per_note": cpu_per_note * 1000,
+        "notes_per_second": 1 / cpu_per_note,
+    }
+
+
+def bench_note_player_persistent():
+    period_seconds = PERIOD_SIZE / SAMPLE_RATE
+    periods = int(1 / period_seconds)
+    notes_per_second = 0
+    worst = 0.0
+    call_seconds = None
+    for notes_per_period in NOTES_PER_PERIOD:
+        synth = SoftSynth(start_audio=False, sample_rate=SAMPLE_RATE)
+        player = NotePlayer(synth)
+        slowest = 0.0
+        calls = 0.0
+        total = 0.0
+        for period in range(periods):
+            start = time.perf_counter()
+            for i in range(notes_per_period):
+                player.play(NOTES[(period + i) % len(NOTES)], duration=0.5)
+            called = time.perf_counter()
+            synth.get_samples(PERIOD_SIZE)
+            elapsed = time.perf_counter() - start
+            slowest = max(slowest, elapsed)
+            total += elapsed
+            calls += called - start
+        player.close()
+        if call_seconds is None:
+            call_seconds = calls / (periods * notes_per_period)
+        if total >= periods * period_seconds:
+            break
+        notes_per_second = notes_per_period / period_seconds
+        worst = slowest
+    return {
+        "call_ms": call_seconds * 1000,
+        "notes_per_second": notes_per_second,
+        "worst_period_ms": worst * 1000,
+        "period_ms": period_seconds * 1000,
+    }
+
+
+BENCHMARKS = [
+    bench_note_player_spawn,
+    bench_note_player_persistent,
+]
@@ -0,0 +1,192 @@
+"""
+Benchmarks for the note path, from a key to the synth.
+"""
+import random
+import time
+import tracemalloc
+
+from benchmarks._common import StubSynth
+from benchmarks._common import ns_per_call
+from upiano.chords import CHORDS
+from upiano.controllers import ControllerUpdates
+from upiano.note_pipeline import LAYER
+from upiano.note_pipeline import SINGLE
+from upiano.note_pipeline import SPLIT
+from upiano.note_pipeline import NotePipeline
+from upiano.recorder import PerformanceRecorder
+
+NOTES_FOR_ALLOCATIONS = 10_000
+# most memory the notes may take at once, whatever their number: a few
+# temporary objects of the loop and calls, not one per note
+MAX_PEAK_BYTES = 512
+STRESS_EVENTS = 50_000
+
+
+def _note_on_off(pipeline):
+    def run():
+        pipeline.note_on(60)
+        pipeline.note_off(60)
+
+    return run
+
+
+def _allocations(play):
+    """
+    Memory taken by many calls to `play`, including the synth's: the peak
+    over the calls shows the allocations freed right away, as well as the
+    ones kept.
+    """
+    play()
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        for _ in range(NOTES_FOR_ALLOCATIONS):
+            play()
+        after, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return after - before, peak - before
+
+
+def bench_note_pipeline():
+    pipeline = NotePipeline(StubSynth())
+    play = _note_on_off(pipeline)
+    kept, peak = _allocations(play)
+    assert peak < MAX_PEAK_BYTES, "the notes allocate: {} bytes".format(peak)
+
+    return {
+        "ns_per_note_on_off": ns_per_call(play),
+        "bytes_kept_per_note": kept / NOTES_FOR_ALLOCATIONS,
+        "peak_bytes": peak,
+    }
+
+
+def bench_chord_pipeline():
+    """
+    A seventh chord played by a key: its four notes go to the synth in one
+    call each way.
+    """
+    synth = StubSynth()
+    pipeline = NotePipeline(synth)
+    pipeline.set_chord("7")
+    play = _note_on_off(pipeline)
+    play()
+    calls = synth.calls
+    play()
+    calls_per_chord = (synth.calls - calls) / 2
+    _, peak = _allocations(play)
+    assert peak < MAX_PEAK_BYTES, "the chords allocate: {} bytes".format(peak)
+    return {
+        "ns_per_chord_on_off": ns_per_call(play),
+        "synth_calls_per_chord": calls_per_chord,
+        "peak_bytes": peak,
+    }
+
+
+def bench_note_pipeline_recording():
+    recorder = PerformanceRecorder()
+    recorder.start()
+    pipeline = NotePipeline(StubSynth(), recorder=recorder)
+    return {"ns_per_note_on_off": ns_per_call(_note_on_off(pipeline))}
+
+
+class _SoundingSynth(StubSynth):
+    """
+    Keeps track of the notes sounding in the synth, and of the calls that
+    would start a note already sounding or stop one that isn't.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.sounding = set()
+        self.redundant_calls = 0
+
+    def notes_on(self, notes, velocity=100):
+        for note in notes:
+            if note in self.sounding:
+                self.redundant_calls += 1
+            self.sounding.add(note)
+
+    def notes_off(self, notes):
+        for note in notes:
+            if note not in self.sounding:
+                self.redundant_calls += 1
+            self.sounding.discard(note)
+
+
+def bench_note_tracking_stress():
+    """
+    Thousands of interleaved presses and releases over a few keys, mixed
+    with transpose, octave, mode and chord changes: once all the keys are
+    released, no note must be left sounding.
+    """
+    synth = _SoundingSynth()
+    pipeline = NotePipeline(synth)
+    rng = random.Random(42)
+    keys = range(55, 67)
+    actions = [
+        (pipeline.note_on, pipeline.note_off)[rng.random() < 0.5]
+        for _ in range(STRESS_EVENTS)
+    ]
+    started = time.perf_counter()
+    for index, action in enumerate(actions):
+        if index % 50 == 0:
+            pipeline.set_transpose(rng.randint(-11, 11))
+        if index % 170 == 0:
+            pipeline.set_octave(rng.randint(-3, 3))
+        if index % 390 == 0:
+            pipeline.set_mode(rng.choice([SINGLE, SPLIT, LAYER]))
+        if index % 230 == 0:
+            pipeline.set_chord(rng.choice([None, *CHORDS]))
+            pipeline.set_inversion(rng.randint(0, 3))
+        action(rng.choice(keys))
+    for key in keys:
+        pipeline.note_off(key)
+    elapsed = time.perf_counter() - started
+
+    assert not synth.sounding, "stuck notes: {}".format(sorted(synth.sounding))
+    assert not synth.redundant_calls, "redundant synth calls"
+    assert not len(pipeline.active)
+
+    pipeline.note_on(60)
+    pipeline.note_on(64)
+    pipeline.all_notes_off()
+    assert not synth.sounding, "notes left after all_notes_off"
+    return {
+        "events": STRESS_EVENTS,
+        "us_per_event": elapsed / STRESS_EVENTS * 1e6,
+        "stuck_notes": len(synth.sounding),
+        "redundant_calls": synth.redundant_calls,
+    }
+
+
+def bench_controller_updates():
+    """
+    A slider dragged back and forth, 8 steps per frame, flushed every frame.
+    """
+    synth = StubSynth()
+    controllers = ControllerUpdates(synth)
+    steps = list(range(0, 128, 4)) + list(range(127, -1, -4))
+
+    def drag():
+        for start in range(0, len(steps), 8):
+            for value in steps[start : start + 8]:
+                controllers.control_change(7, value)
+            controllers.flush()
+
+    ns = ns_per_call(drag)
+    return {
+        "ns_per_update": ns / len(steps),
+        "messages_per_update": controllers.sent / controllers.received,
+        **controllers.stats(),
+    }
+
+
+BENCHMARKS = [
+    bench_note_pipeline,
+    bench_chord_pipeline,
+    bench_note_pipeline_recording,
+    bench_note_tracking_stress,
+    bench_controller_updates,
+]
@@ -0,0 +1,55 @@
+"""
+Benchmarks for the key rendering and note conversion functions.
+"""
+from benchmarks._common import ns_per_call
+from upiano import midi
+from upiano.keyboard_ui import NOTES
+from upiano.note_render import lower_part_key_image
+from upiano.note_render import prebuild_key_images
+from upiano.note_render import render_lower_part_key
+from upiano.note_render import render_upper_part_key
+from upiano.note_render import upper_part_key_image
+
+
+def _each_note(func):
+    def run():
+        for note in NOTES:
+            func(note)
+
+    return run
+
+
+def bench_render_upper_part_key():
+    return {
+        "ns_per_key": ns_per_call(
+            _each_note(lambda note: render_upper_part_key(note, use_rich=True))
+        )
+        / len(NOTES)
+    }
+
+
+def bench_render_lower_part_key():
+    return {"ns_per_key": ns_per_call(lambda: render_lower_part_key(use_rich=True))}
+
+
+def bench_key_image_lookup():
+    prebuild_key_images(use_rich=True)
+    return {
+        "upper_ns_per_key": ns_per_call(
+            _each_note(lambda note: upper_part_key_image(note, use_rich=True))
+        )
+        / len(NOTES),
+        "lower_ns_per_key": ns_per_call(lambda: lower_part_key_image(use_rich=True)),
+    }
+
+
+def bench_note_to_midi():
+    return {"ns_per_note": ns_per_call(_each_note(midi.note_to_midi)) / len(NOTES)}
+
+
+BENCHMARKS = [
+    bench_render_upper_part_key,
+    bench_render_lower_part_key,
+    bench_key_image_lookup,
+    bench_note_to_midi,
+]
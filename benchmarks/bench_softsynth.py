@@ -0,0 +1,76 @@
+"""
+Benchmarks for the NumPy synthesizer: how much faster than real time it
+renders with more and more voices, and how many voices it plays before a
+period of audio takes longer to render than it lasts.
+"""
+import time
+
+from upiano.softsynth import MAX_VOICES
+from upiano.softsynth import SoftSynth
+
+SAMPLE_RATE = 48000
+PERIOD_SIZE = 512
+PERIODS = 200
+VOICE_COUNTS = [1, 4, 8, 16, 32, 64]
+# pianos (strings) and strings (additive voices)
+PROGRAMS = {0: 0, 1: 48}
+
+
+def _synth_playing(voices):
+    synth = SoftSynth(start_audio=False, sample_rate=SAMPLE_RATE)
+    for channel, program in PROGRAMS.items():
+        synth.select_midi_program(program, channel)
+    for i in range(voices):
+        # spread over the keyboard, alternating the instruments
+        synth.note_on(36 + i * 7 % 60, channel=i % len(PROGRAMS))
+    return synth
+
+
+def _worst_period_seconds(synth):
+    worst = 0.0
+    for _ in range(PERIODS):
+        start = time.perf_counter()
+        synth.get_samples(PERIOD_SIZE)
+        worst = max(worst, time.perf_counter() - start)
+    return worst
+
+
+def bench_softsynth_realtime_factor():
+    results = {}
+    for voices in VOICE_COUNTS:
+        synth = _synth_playing(voices)
+        synth.get_samples(PERIOD_SIZE)
+        start = time.perf_counter()
+        synth.get_samples(SAMPLE_RATE)
+        elapsed = time.perf_counter() - start
+        results["voices_{}".format(voices)] = 1 / elapsed
+    return results
+
+
+def bench_softsynth_polyphony():
+    """
+    The most voices rendered with every period (of PERIOD_SIZE frames)
+    ready in time.
+    """
+    period_seconds = PERIOD_SIZE / SAMPLE_RATE
+    polyphony = 0
+    worst = 0.0
+    for voices in VOICE_COUNTS:
+        synth = _synth_playing(voices)
+        synth.get_samples(PERIOD_SIZE)
+        seconds = _worst_period_seconds(synth)
+        if seconds >= period_seconds:
+            break
+        polyphony, worst = voices, seconds
+    return {
+        "max_voices": polyphony,
+        "voice_limit": MAX_VOICES,
+        "worst_period_ms": worst * 1000,
+        "period_ms": period_seconds * 1000,
+    }
+
+
+BENCHMARKS = [
+    bench_softsynth_realtime_factor,
+    bench_softsynth_polyphony,
+]
@@ -0,0 +1,105 @@
+"""
+Benchmarks for the keyboard widgets, driven headlessly by Textual's pilot.
+"""
+import asyncio
+import time
+from types import SimpleNamespace
+
+from benchmarks._common import install_stub_synth
+from benchmarks._common import ns_per_call
+from upiano.keyboard_ui import OCTAVES
+from upiano.keyboard_ui import KeyboardCanvas
+from upiano.keyboard_ui import KeyboardWidget
+
+WIDTHS = [80, 160, 320]
+KEYBOARDS = [KeyboardWidget, KeyboardCanvas]
+HIGHLIGHT_TOGGLES = 200
+SCROLLS = 40
+
+
+def bench_keyboard_construction():
+    return {
+        cls.__name__: {
+            "us": ns_per_call(lambda: cls(note_on=print, note_off=print), repeat=3)
+            / 1000
+        }
+        for cls in KEYBOARDS
+    }
+
+
+def bench_keyboard_hit_testing():
+    """
+    Mouse moves over the whole MIDI range, with and without the button
+    pressed: the time to find the key under the mouse, and the synth calls.
+    """
+    keyboard = KeyboardCanvas(note_on=print, note_off=print)
+    keyboard.show_octaves(0, OCTAVES)
+    width = len(keyboard._key_rows[0])
+
+    def sweep():
+        for x in range(width):
+            keyboard.key_at(x, 10)
+
+    def synth_calls(pressed):
+        calls = []
+        keyboard.note_on = keyboard.note_off = calls.append
+        keyboard._mouse_pressed = pressed
+        for x in range(width):
+            keyboard.on_mouse_move(SimpleNamespace(screen_x=x, screen_y=10))
+        keyboard._release()
+        return len(calls)
+
+    return {
+        "ns_per_lookup": ns_per_call(sweep) / width,
+        "synth_calls_hovering": synth_calls(pressed=False),
+        "synth_calls_swiping": synth_calls(pressed=True),
+    }
+
+
+async def _mount_and_toggle(cls, width):
+    app = install_stub_synth().MyApp(keyboard_class=cls)
+    started = time.perf_counter()
+    async with app.run_test(size=(width, 40)) as pilot:
+        await pilot.pause()
+        mounted = time.perf_counter() - started
+
+        keyboard = app.keyboard_widget
+        keys = keyboard.visible_keys
+        started = time.perf_counter()
+        for i in range(HIGHLIGHT_TOGGLES):
+            key = keys[i % len(keys)]
+            keyboard.highlight_key(key, True)
+            await pilot.pause()
+            keyboard.highlight_key(key, False)
+        await pilot.pause()
+        toggling = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for i in range(SCROLLS):
+            # up and down the whole range, without stopping at its ends
+            keyboard.scroll_octaves(1 if i // 10 % 2 else -1)
+            await pilot.pause()
+        scrolling = time.perf_counter() - started
+
+    return {
+        "mount_ms": mounted * 1000,
+        "keys_shown": len(keys),
+        "highlight_toggles_per_second": HIGHLIGHT_TOGGLES / toggling,
+        "octave_scrolls_per_second": SCROLLS / scrolling,
+    }
+
+
+def bench_keyboard_mount_and_highlight():
+    return {
+        cls.__name__: {
+            str(width): asyncio.run(_mount_and_toggle(cls, width)) for width in WIDTHS
+        }
+        for cls in KEYBOARDS
+    }
+
+
+BENCHMARKS = [
+    bench_keyboard_construction,
+    bench_keyboard_hit_testing,
+    bench_keyboard_mount_and_highlight,
+]
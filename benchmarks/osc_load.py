@@ -0,0 +1,89 @@
+"""
+Load test for the OSC server of a running upiano (upiano --osc-port PORT).
+
+Sends note messages at a steady rate, then asks the server how many it
+received, and prints the sustained throughput and drop rate as JSON.
+"""
+import argparse
+import json
+import socket
+import time
+
+from upiano.osc import DEFAULT_HOST
+from upiano.osc import STATS_ADDRESS
+from upiano.osc import encode_message
+from upiano.osc import parse_message
+
+# messages sent between checks of the clock
+BURST = 50
+
+
+def server_stats(sock, address, timeout=2.0):
+    sock.settimeout(timeout)
+    sock.sendto(encode_message(STATS_ADDRESS), address)
+    while True:
+        data, _ = sock.recvfrom(1024)
+        reply_address, (packets, messages, errors) = parse_message(data)
+        if reply_address == STATS_ADDRESS:
+            return packets, messages, errors
+
+
+def run(port, rate, duration, host=DEFAULT_HOST):
+    address = (host, port)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    # quiet notes over two octaves, each one released right away
+    messages = []
+    for note in range(48, 72):
+        messages.append(encode_message("/note_on", note, 20))
+        messages.append(encode_message("/note_off", note))
+
+    packets_before, _, errors_before = server_stats(sock, address)
+    sent = 0
+    failed = 0
+    started = time.perf_counter()
+    deadline = started + duration
+    while True:
+        now = time.perf_counter()
+        if now >= deadline:
+            break
+        due = int((now - started) * rate) - sent
+        if due <= 0:
+            time.sleep(min(BURST / rate, deadline - now))
+            continue
+        for _ in range(min(due, BURST)):
+            try:
+                sock.sendto(messages[sent % len(messages)], address)
+            except OSError:
+                failed += 1
+            sent += 1
+    elapsed = time.perf_counter() - started
+
+    # let the server catch up with what's still in its socket buffer
+    time.sleep(0.5)
+    packets_after, _, errors_after = server_stats(sock, address)
+    # the stats request itself counts as a packet
+    received = packets_after - packets_before - 1
+    return {
+        "sent": sent,
+        "send_errors": failed,
+        "received": received,
+        "server_errors": errors_after - errors_before,
+        "seconds": elapsed,
+        "sent_per_second": sent / elapsed,
+        "received_per_second": received / elapsed,
+        "drop_rate": 1 - received / sent if sent else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, required=True)
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--rate", type=float, default=5000, help="messages per second")
+    parser.add_argument("--duration", type=float, default=10, help="in seconds")
+    args = parser.parse_args()
+    print(json.dumps(run(args.port, args.rate, args.duration, args.host), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -3,7 +3,10 @@ UPiano - A piano in your terminal
 """
 
 import os
+import sys
+import time
 from dataclasses import dataclass
+from dataclasses import field
 
 from textual.app import App
 from textual.containers import Container
@@ -14,29 +17,64 @@ from textual.widgets import Label
 from textual.widgets import Select
 
 from upiano import midi
-from upiano.keyboard_ui import KEYMAP_CHAR_TO_INDEX
+from upiano.audio import AudioMonitor
+from upiano.audio import make_settings
+from upiano.chords import CHORDS
+from upiano.controllers import ControllerUpdates
+from upiano.key_release import KeyReleaseDetector
+from upiano.keyboard_ui import KeyboardCanvas
 from upiano.keyboard_ui import KeyboardWidget
+from upiano.keymap import KEYMAP_CHARACTER_TO_INDEX
+from upiano.kitty_keyboard import PRESS
+from upiano.kitty_keyboard import RELEASE
+from upiano.latency import MONITOR
+from upiano.midi_input import MidiInput
+from upiano.note_pipeline import LAYER
+from upiano.note_pipeline import MAIN_CHANNEL
+from upiano.note_pipeline import MIDI_NOTES
+from upiano.note_pipeline import SECOND_CHANNEL
+from upiano.note_pipeline import SINGLE
+from upiano.note_pipeline import SPLIT
+from upiano.note_pipeline import KeyboardPlayingSettings
+from upiano.note_pipeline import NotePipeline
+from upiano.osc import OscServer
+from upiano.player import MidiFilePlayer
+from upiano.recorder import PerformanceRecorder
+from upiano.smf import PROGRAM_CHANGE
+from upiano.widgets import LabeledSelect
 from upiano.widgets import LabeledSwitch
+from upiano.widgets import LatencyPanel
 from upiano.widgets import LabeledSlider
 from upiano.widgets import NumericUpDownControl
 
 SOUNDFONTS_DIR = os.path.join(os.path.dirname(__file__), "soundfonts")
 
 
-@dataclass
-class KeyboardPlayingSettings:
-    octave: int = 0
-    transpose: int = 0
+PLAY_SETTINGS = KeyboardPlayingSettings()
 
+# how often the pending controller updates are sent to the synth
+CONTROLLERS_FLUSH_INTERVAL = 1 / 60
+
+# how often the load of the synth is checked for late audio buffers
+AUDIO_CHECK_INTERVAL = 1.0
+
+RECORDER = PerformanceRecorder()
 
-PLAY_SETTINGS = KeyboardPlayingSettings()
 
+def control_change(control: int, value: int, channel: int = 0):
+    controllers.control_change(control, value, channel)
 
-def transpose_note(note_value: int):
+
+@dataclass
+class PartSettings:
     """
-    Transpose a note value by the current settings (transpose and octave)
+    The sound of a part of the keyboard, played on its own channel.
     """
-    return note_value + PLAY_SETTINGS.transpose + PLAY_SETTINGS.octave * 12
+
+    program: int = 0
+    controls: dict = field(
+        default_factory=lambda: {midi.VOLUME: 100, midi.REVERB: 0, midi.CHORUS: 0}
+    )
 
 
 class InstrumentSelector(Widget):
@@ -58,98 +96,435 @@ class InstrumentSelector(Widget):
 
     def on_select_changed(self, event):
         if event.value is not None:
-            synthesizer.select_midi_program(event.value)
-
-
-def tranposed_note_on(note_value: int):
-    synthesizer.note_on(transpose_note(note_value), velocity=100)
-
-
-def transposed_note_off(note_value: int):
-    synthesizer.note_off(transpose_note(note_value))
+            self.app.change_program(event.value)
 
 
 class MyApp(App):
     BINDINGS = [
         ("ctrl-c", "quit", "Quit"),
         ("insert", "toggle_sustain", "Toggle sustain"),
+        ("f8", "panic", "Panic"),
+        ("f9", "toggle_recording", "Record"),
+        ("f10", "save_recording", "Save recording"),
+        ("f12", "toggle_latency_panel", "Latency"),
+        ("pagedown", "scroll_keyboard(-1)", "Lower keys"),
+        ("pageup", "scroll_keyboard(1)", "Higher keys"),
     ]
     CSS_PATH = os.path.join(os.path.dirname(__file__), "style.css")
     TITLE = "UPiano"
     SUB_TITLE = "A piano in your terminal"
 
+    def __init__(
+        self,
+        keyboard_class=KeyboardWidget,
+        midi_file=None,
+        recording_file=None,
+        midi_in=None,
+        osc_port=None,
+        exit_after_startup=False,
+        auto_buffer=False,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+        self.keyboard_class = keyboard_class
+        self.midi_file = midi_file
+        self.recording_file = recording_file
+        self.exit_after_startup = exit_after_startup
+        self.auto_buffer = auto_buffer
+        self.audio_monitor = None
+        # the part whose sound the controls change
+        self.part_channel = MAIN_CHANNEL
+        self.parts = {MAIN_CHANNEL: PartSettings(), SECOND_CHANNEL: PartSettings()}
+        self.midi_in = midi_in
+        self.osc_port = osc_port
+        self.player = None
+        self.midi_input = None
+        self.osc_server = None
+        # the notes played by the player and the MIDI inputs, and whether
+        # each source may still play more
+        self._note_sources = []
+        self._notes_timer = None
+        # whether each pitch is shown as played by them
+        self._shown_notes = bytearray(MIDI_NOTES)
+        # whether the terminal reports key releases (kitty keyboard protocol)
+        self.key_states = False
+
     def compose(self):
         yield Header()
         yield Footer()
-        self.keyboard_widget = KeyboardWidget(
-            note_on=tranposed_note_on,
-            note_off=transposed_note_off,
+        self.keyboard_widget = self.keyboard_class(
+            note_on=note_pipeline.note_on,
+            note_off=note_pipeline.note_off,
+            key_values=note_pipeline.key_values,
+        )
+        self.key_release = KeyReleaseDetector(
+            on_release=self.release_key,
+            scheduler=self.keyboard_widget.scheduler,
         )
         with Container(id="main"):
             with Container(id="controls"):
                 yield InstrumentSelector()
                 yield NumericUpDownControl(
                     "Transpose",
-                    lambda value: setattr(PLAY_SETTINGS, "transpose", value),
+                    note_pipeline.set_transpose,
                     min_value=-11,
                     max_value=11,
                 )
                 yield NumericUpDownControl(
                     "Octave",
-                    lambda value: setattr(PLAY_SETTINGS, "octave", value),
+                    note_pipeline.set_octave,
                     min_value=-3,
                     max_value=3,
                 )
-                yield LabeledSwitch(
-                    "Sustain",
-                    lambda value: synthesizer.set_sustain(100 if value else 0),
-                )
+                yield LabeledSwitch("Sustain", self.set_sustain)
                 yield LabeledSlider(
                     "Volume",
-                    lambda value: synthesizer.set_volume(value),
+                    lambda value: self.part_control_change(midi.VOLUME, value),
                 )
                 yield LabeledSlider(
                     "Reverb",
-                    lambda value: synthesizer.set_reverb(value),
+                    lambda value: self.part_control_change(midi.REVERB, value),
                     value=0,
                 )
                 yield LabeledSlider(
                     "Chorus",
-                    lambda value: synthesizer.set_chorus(value),
+                    lambda value: self.part_control_change(midi.CHORUS, value),
                     value=0,
                 )
+                yield LabeledSelect(
+                    "Mode",
+                    [("Single", SINGLE), ("Split", SPLIT), ("Layer", LAYER)],
+                    note_pipeline.set_mode,
+                )
+                yield LabeledSelect(
+                    "Part",
+                    [
+                        ("Main / upper", MAIN_CHANNEL),
+                        ("Second / lower", SECOND_CHANNEL),
+                    ],
+                    self.select_part,
+                )
+                yield NumericUpDownControl(
+                    "Split",
+                    lambda value: note_pipeline.set_split_point(60 + 12 * value),
+                    min_value=0,
+                    max_value=3,
+                )
+                yield LabeledSelect(
+                    "Chord",
+                    [("Off", "")] + [(name, name) for name in CHORDS],
+                    lambda chord: note_pipeline.set_chord(chord or None),
+                    value=PLAY_SETTINGS.chord or "",
+                )
+                yield NumericUpDownControl(
+                    "Inversion",
+                    note_pipeline.set_inversion,
+                    min_value=0,
+                    max_value=3,
+                )
+            yield LatencyPanel(MONITOR)
             yield self.keyboard_widget
 
+    def set_sustain(self, value):
+        # the pedal holds the notes of all the parts
+        for channel in self.parts:
+            control_change(midi.SUSTAIN, 100 if value else 0, channel)
+        # not worth waiting for the next flush, it's a single change
+        controllers.flush()
+
+    # the controls showing a part's settings, when it's selected, call these
+    # back with its own values: only the changes are sent
+
+    def part_control_change(self, control, value):
+        controls = self.parts[self.part_channel].controls
+        if controls[control] == value:
+            return
+        controls[control] = value
+        control_change(control, value, self.part_channel)
+
+    def change_program(self, program):
+        part = self.parts[self.part_channel]
+        if part.program == program:
+            return
+        part.program = program
+        synthesizer.select_midi_program(program, self.part_channel)
+        RECORDER.record(PROGRAM_CHANGE | self.part_channel, program)
+
+    def select_part(self, channel):
+        """
+        Make the instrument and sound controls change the given part, and
+        show its settings.
+        """
+        self.part_channel = channel
+        part = self.parts[channel]
+        self.query_one(InstrumentSelector).query_one(Select).value = part.program
+        self.query_one("#volume", LabeledSlider).set_value(part.controls[midi.VOLUME])
+        self.query_one("#reverb", LabeledSlider).set_value(part.controls[midi.REVERB])
+        self.query_one("#chorus", LabeledSlider).set_value(part.controls[midi.CHORUS])
+
     def action_toggle_sustain(self):
         self.query_one(LabeledSwitch).toggle()
 
-    def on_key(self, event):
-        # TODO: since the terminal doesn't have a key up and down events, we'll
-        # have to come up with a way emulate them. Maybe by a set_interval
-        # function, which will keep track of the time we get each "key pressed"
-        # event and compare the time of current event to the previous one. If
-        # the difference is too big, we'll assume that the key was released.
-        key = event.key.upper()
-        note_index = KEYMAP_CHAR_TO_INDEX.get(key)
-        if note_index is not None:
-            self.keyboard_widget.play_key(note_index)
-
-
-def run_app(args):
-    global synthesizer
-    synthesizer = midi.MidiSynth()
-
-    MyApp().run()
+    def action_panic(self):
+        """
+        Silence everything: the keys held, and whatever other sources play.
+        """
+        self.key_release.release_all()
+        self.keyboard_widget.release_all_keys()
+        note_pipeline.all_notes_off()
+        for channel in range(16):
+            # unlike All Notes Off, it also stops the sustained notes
+            synthesizer.control_change(midi.ALL_SOUND_OFF, 0, channel)
+        for played_notes, _ in self._note_sources:
+            played_notes.clear()
+        self._show_played_notes()
+
+    def action_scroll_keyboard(self, octaves):
+        self.keyboard_widget.scroll_octaves(octaves)
+
+    def action_toggle_latency_panel(self):
+        self.query_one(LatencyPanel).toggle()
+
+    def action_toggle_recording(self):
+        if RECORDER.recording:
+            RECORDER.stop()
+            self.notify("Recording stopped")
+        else:
+            RECORDER.start()
+            self.notify("Recording...")
+
+    def action_save_recording(self):
+        if not len(RECORDER):
+            self.notify("Nothing recorded yet", severity="warning")
+            return
+        path = self.recording_file or time.strftime("upiano-%Y%m%d-%H%M%S.mid")
+        RECORDER.save(path)
+        self.notify("Recording saved to {}".format(path))
+
+    def on_mount(self):
+        self.call_after_refresh(self._startup_phase_done, "first_frame")
+        self._controllers_timer = self.set_interval(
+            CONTROLLERS_FLUSH_INTERVAL,
+            self._flush_controllers,
+            pause=not controllers,
+        )
+        controllers.wakeup = self._controllers_timer.resume
+        if self.recording_file:
+            RECORDER.start()
+        if isinstance(synthesizer, midi.BackgroundMidiSynth) and synthesizer.loading:
+            self.sub_title = "Loading soundfont..."
+            self._synth_timer = self.set_interval(0.1, self._check_synth_loaded)
+        else:
+            self._startup_phase_done("sound_ready")
+            self.on_synth_ready()
+
+    def on_unmount(self):
+        if self.osc_server is not None:
+            self.osc_server.stop()
+
+    def _flush_controllers(self):
+        controllers.flush()
+        self._controllers_timer.pause()
+
+    def _check_synth_loaded(self):
+        if synthesizer.loading:
+            return
+        self._synth_timer.stop()
+        self.sub_title = self.SUB_TITLE
+        if synthesizer.error is not None:
+            self.sub_title = "No sound: the synthesizer failed to start"
+            self.notify(str(synthesizer.error), severity="error", timeout=10)
+            self._startup_phase_done("synth_failed")
+            return
+        self._startup_phase_done("sound_ready", at=synthesizer.ready_at)
+        if synthesizer.dropped_notes:
+            self.notify(
+                "{} notes were not played while the soundfont was loading".format(
+                    synthesizer.dropped_notes
+                ),
+                severity="warning",
+            )
+        self.on_synth_ready()
+
+    def _startup_phase_done(self, name, at=None):
+        MONITOR.startup_phase(name, at=at)
+        if self.exit_after_startup and "first_frame" in MONITOR.startup:
+            if "sound_ready" in MONITOR.startup or "synth_failed" in MONITOR.startup:
+                self.exit()
+
+    def on_synth_ready(self):
+        if getattr(synthesizer, "synth", None) is not None:
+            self.start_audio_monitor(synthesizer.synth)
+        if self.midi_file:
+            self.play_midi_file(self.midi_file)
+        if self.midi_in:
+            self.start_midi_input(self.midi_in)
+        if self.osc_port:
+            self.call_later(self.start_osc_server, self.osc_port)
+
+    def start_audio_monitor(self, synth):
+        fallback_reason = getattr(synth, "fallback_reason", None)
+        if fallback_reason:
+            self.notify(
+                "Using the built-in synthesizer: {}".format(fallback_reason),
+                severity="warning",
+                timeout=10,
+            )
+        self.audio_monitor = AudioMonitor(synth, auto_adjust=self.auto_buffer)
+        self.query_one(LatencyPanel).audio_monitor = self.audio_monitor
+        self.set_interval(AUDIO_CHECK_INTERVAL, self._check_audio)
+
+    def _check_audio(self):
+        if self.audio_monitor.check():
+            settings = self.audio_monitor.settings
+            self.notify(
+                "The audio was late, buffer raised to {} frames ({:.1f}ms)".format(
+                    settings.period_size, settings.latency_ms
+                ),
+                severity="warning",
+            )
+
+    def play_midi_file(self, path):
+        self.player = MidiFilePlayer(
+            synthesizer,
+            path,
+            on_error=lambda error: self.call_from_thread(
+                self.notify,
+                "Can't play {}: {}".format(path, error),
+                severity="error",
+            ),
+        )
+        self.player.start()
+        self.add_note_source(self.player.played_notes, lambda: self.player.playing)
+
+    def start_midi_input(self, path):
+        self.midi_input = MidiInput(synthesizer, path)
+        try:
+            self.midi_input.start()
+        except OSError as error:
+            self.midi_input = None
+            self.notify(
+                "Can't read MIDI from {}: {}".format(path, error), severity="error"
+            )
+            return
+        self.add_note_source(
+            self.midi_input.played_notes, lambda: self.midi_input.running
+        )
 
+    async def start_osc_server(self, port):
+        server = OscServer(synthesizer)
+        try:
+            await server.start(port)
+        except OSError as error:
+            self.notify(
+                "Can't listen on UDP port {}: {}".format(port, error), severity="error"
+            )
+            return
+        self.osc_server = server
+        self.add_note_source(server.played_notes)
+
+    def add_note_source(self, played_notes, running=None):
+        """
+        Show on the keyboard the notes counted in a PlayedNotes by another
+        thread, for as long as `running()` is true, or always without it.
+        """
+        self._note_sources.append((played_notes, running))
+        if self._notes_timer is None:
+            self._notes_timer = self.set_interval(1 / 30, self._show_played_notes)
+        else:
+            self._notes_timer.resume()
+
+    def _show_played_notes(self):
+        # checked first: a source that's done has its final counts by then
+        done = all(
+            running is not None and not running() for _, running in self._note_sources
+        )
+        shown = self._shown_notes
+        counts = [played_notes.counts for played_notes, _ in self._note_sources]
+        # only the notes still on or off by now are shown, not the ones that
+        # started and ended since the last time
+        for pitch in range(MIDI_NOTES):
+            is_on = any(source[pitch] for source in counts)
+            if is_on != shown[pitch]:
+                shown[pitch] = is_on
+                self.keyboard_widget.highlight_midi_note(pitch, is_on)
+        if done and self._notes_timer is not None:
+            self._notes_timer.pause()
+
+    def release_key(self, note_index):
+        self.keyboard_widget.release_key(note_index)
+
+    def on_keyboard_protocol_supported(self, event):
+        self.key_states = True
+        # stop guessing the releases of the keys being held
+        self.key_release.release_all()
+
+    def on_key_state_change(self, event):
+        if not self.key_states:
+            return
+        note_index = KEYMAP_CHARACTER_TO_INDEX.get(event.character)
+        if note_index is None:
+            return
+        if event.event_type == PRESS:
+            MONITOR.input_received(event.time)
+            self.keyboard_widget.press_key(note_index)
+        elif event.event_type == RELEASE:
+            self.keyboard_widget.release_key(note_index)
 
-def main():
-    import argparse
+    def on_key(self, event):
+        note_index = KEYMAP_CHARACTER_TO_INDEX.get(event.character)
+        if note_index is not None and not self.key_states:
+            if self.key_release.key_event(note_index, event.time):
+                MONITOR.input_received(event.time)
+                self.keyboard_widget.press_key(note_index)
 
-    parser = argparse.ArgumentParser(description=__doc__)
 
-    args = parser.parse_args()
-    run_app(args)
+def run_app(args):
+    global synthesizer, note_pipeline, controllers
+    audio_settings = make_settings(
+        "low-latency" if args.low_latency else "default",
+        driver=args.audio_driver,
+        sample_rate=args.audio_sample_rate,
+        period_size=args.period_size,
+        periods=args.periods,
+    )
+    synthesizer = midi.BackgroundMidiSynth(
+        audio_settings=audio_settings, engine=args.synth
+    )
+    PLAY_SETTINGS.chord = args.chord
+    note_pipeline = NotePipeline(synthesizer, PLAY_SETTINGS, recorder=RECORDER)
+    controllers = ControllerUpdates(synthesizer, recorder=RECORDER)
+
+    keyboard_class = KeyboardCanvas if args.canvas_keyboard else KeyboardWidget
+    driver_class = None
+    if args.kitty_keyboard and sys.platform != "win32":
+        from upiano.kitty_driver import KittyKeyboardDriver
+
+        driver_class = KittyKeyboardDriver
+    app = MyApp(
+        keyboard_class=keyboard_class,
+        midi_file=args.play,
+        recording_file=args.record,
+        midi_in=args.midi_in,
+        osc_port=args.osc_port,
+        exit_after_startup=args.profile_startup,
+        auto_buffer=args.auto_buffer,
+        driver_class=driver_class,
+    )
+    MONITOR.startup_phase("app_created")
+    app.run()
+    if app.player is not None:
+        app.player.stop()
+    if app.midi_input is not None:
+        app.midi_input.stop()
+    if args.record and len(RECORDER):
+        RECORDER.save(args.record)
+
+    if args.latency_report:
+        MONITOR.write_report(args.latency_report)
 
 
 if __name__ == "__main__":
+    from upiano.cli import main
+
     main()
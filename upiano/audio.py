@@ -0,0 +1,136 @@
+"""
+Audio output settings, and monitoring of the synth keeping up with them.
+"""
+from dataclasses import dataclass
+from dataclasses import replace
+
+# largest period size the monitor steps up to, in frames
+MAX_PERIOD_SIZE = 4096
+
+# CPU load of the synth, in percent of real time, above which its buffers
+# are at risk of being late
+LATE_LOAD = 80.0
+
+
+@dataclass
+class AudioSettings:
+    """
+    Audio output of the synth: fluidsynth's driver, sample rate, and the
+    size (in frames) and count of the periods of its buffer. None leaves
+    fluidsynth's default, which depends on the platform.
+    """
+
+    driver: str = None
+    sample_rate: int = 44100
+    period_size: int = None
+    periods: int = None
+
+    def fluidsynth_settings(self):
+        settings = {}
+        if self.period_size is not None:
+            settings["audio.period-size"] = self.period_size
+        if self.periods is not None:
+            settings["audio.periods"] = self.periods
+        return settings
+
+    @property
+    def latency_ms(self):
+        """
+        The output latency of the buffer, if the period size and count are
+        known.
+        """
+        if self.period_size is None or self.periods is None:
+            return None
+        return self.period_size * self.periods / self.sample_rate * 1000
+
+    def with_larger_periods(self):
+        return replace(self, period_size=min(self.period_size * 2, MAX_PERIOD_SIZE))
+
+    def describe(self):
+        text = "{}, {} Hz".format(self.driver or "default driver", self.sample_rate)
+        if self.latency_ms is not None:
+            text += ", {} x {} frames = {:.1f}ms".format(
+                self.periods, self.period_size, self.latency_ms
+            )
+        return text
+
+
+PRESETS = {
+    "default": AudioSettings(),
+    # small buffers at the rate most audio servers run at, so that they
+    # don't resample
+    "low-latency": AudioSettings(sample_rate=48000, period_size=128, periods=2),
+}
+
+
+def make_settings(preset="default", **overrides):
+    """
+    Return the settings of a preset, with the overrides that aren't None.
+    """
+    overrides = {name: value for name, value in overrides.items() if value is not None}
+    return replace(PRESETS[preset], **overrides)
+
+
+class AudioMonitor:
+    """
+    Watches whether the synth renders its audio in time.
+
+    fluidsynth doesn't tell about the underruns of its audio driver, but it
+    measures its CPU load: the time it takes to render the buffers, in
+    percent of the time they last. Close to 100%, buffers are late and the
+    output underruns. `check` is called periodically: a load over
+    `threshold` counts as a late check, and with `auto_adjust`, after
+    `patience` late checks in a row the period size is doubled (up to
+    MAX_PERIOD_SIZE), trading latency for headroom.
+    """
+
+    def __init__(self, synth, auto_adjust=False, threshold=LATE_LOAD, patience=3):
+        self.synth = synth
+        self.auto_adjust = auto_adjust
+        self.threshold = threshold
+        self.patience = patience
+        self.settings = synth.audio_settings()
+        self.load = None
+        self.peak_load = 0.0
+        self.late_checks = 0
+        self.adjustments = 0
+        self._late_in_a_row = 0
+
+    def check(self, load=None):
+        """
+        Sample the synth's load, returning True if the buffers were made
+        larger.
+        """
+        if load is None:
+            load = self.synth.cpu_load()
+            if load is None:
+                return False
+        self.load = load
+        self.peak_load = max(self.peak_load, load)
+        if load < self.threshold:
+            self._late_in_a_row = 0
+            return False
+
+        self.late_checks += 1
+        self._late_in_a_row += 1
+        if (
+            not self.auto_adjust
+            or self._late_in_a_row < self.patience
+            or self.settings.period_size is None
+            or self.settings.period_size >= MAX_PERIOD_SIZE
+        ):
+            return False
+        self._late_in_a_row = 0
+        self.synth.restart_audio(self.settings.with_larger_periods())
+        self.settings = self.synth.audio_settings()
+        self.adjustments += 1
+        return True
+
+    def describe(self):
+        text = "Audio   " + self.settings.describe()
+        if self.load is not None:
+            text += "   load {:.0f}% (peak {:.0f}%)".format(self.load, self.peak_load)
+        text += "   late: {}".format(self.late_checks)
+        if self.adjustments:
+            text += "   buffer raised: {}".format(self.adjustments)
+        return text
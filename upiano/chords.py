@@ -0,0 +1,72 @@
+"""
+Chords played by a single key, as intervals in semitones from the key.
+"""
+
+
+def _inversions(intervals):
+    """
+    Return the intervals of each inversion of a chord: in the inversion n,
+    its n lowest notes are moved up an octave.
+    >>> _inversions((0, 4, 7))
+    ((0, 4, 7), (4, 7, 12), (7, 12, 16))
+    """
+    return tuple(
+        intervals[n:] + tuple(interval + 12 for interval in intervals[:n])
+        for n in range(len(intervals))
+    )
+
+
+CHORDS = {
+    "major": (0, 4, 7),
+    "minor": (0, 3, 7),
+    "diminished": (0, 3, 6),
+    "augmented": (0, 4, 8),
+    "sus4": (0, 5, 7),
+    "7": (0, 4, 7, 10),
+    "maj7": (0, 4, 7, 11),
+    "m7": (0, 3, 7, 10),
+}
+
+# the intervals of each inversion of the chords, computed once
+INVERSIONS = {name: _inversions(intervals) for name, intervals in CHORDS.items()}
+
+
+def add_voicing(name, intervals):
+    """
+    Add a chord, or replace one, with its intervals from the key played.
+    """
+    intervals = tuple(sorted(set(intervals)))
+    CHORDS[name] = intervals
+    INVERSIONS[name] = _inversions(intervals)
+
+
+def parse_voicing(text):
+    """
+    Parse a chord given as NAME=INTERVALS, e.g. "add9=0,4,7,14".
+    """
+    name, _, intervals = text.partition("=")
+    try:
+        intervals = [int(interval) for interval in intervals.split(",")]
+    except ValueError:
+        intervals = None
+    if not name or not intervals or not all(0 <= i < 128 for i in intervals):
+        raise ValueError(
+            "a voicing is a name and intervals from 0 to 127, such as add9=0,4,7,14"
+        )
+    return name, intervals
+
+
+def chord_intervals(chord, inversion=0):
+    """
+    Return the intervals played for a chord and inversion (counted in turns
+    around the chord, so any number works), or just the key's own note
+    without a chord.
+    >>> chord_intervals("major", 1)
+    (4, 7, 12)
+    >>> chord_intervals(None)
+    (0,)
+    """
+    if chord is None:
+        return (0,)
+    inversions = INVERSIONS[chord]
+    return inversions[inversion % len(inversions)]
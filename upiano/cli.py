@@ -0,0 +1,220 @@
+"""
+UPiano - A piano in your terminal
+"""
+from time import perf_counter
+
+STARTED = perf_counter()
+
+
+def run_app(args):
+    from upiano.latency import MONITOR
+
+    MONITOR.begin_startup(at=STARTED)
+    if args.headless:
+        from upiano.headless import run_headless
+
+        run_headless(args)
+        return
+    profiler = None
+    if args.profile_startup:
+        from upiano.startup import ImportProfiler
+
+        profiler = ImportProfiler()
+        profiler.install()
+    try:
+        from upiano import app
+    finally:
+        if profiler is not None:
+            profiler.uninstall()
+    MONITOR.startup_phase("app_imported")
+
+    app.run_app(args)
+
+    if profiler is not None:
+        from upiano.startup import phases_report
+
+        print(profiler.report())
+        print(phases_report(MONITOR.startup))
+
+
+def run_render(args):
+    import sys
+    from importlib.util import find_spec
+
+    # pyFluidSynth returns the rendered audio as NumPy arrays
+    if find_spec("numpy") is None:
+        sys.exit("upiano: rendering needs NumPy: pip install upiano[render]")
+    from upiano.render import render_midi_file
+
+    result = render_midi_file(
+        args.midi_file,
+        args.output,
+        soundfont_name=args.soundfont,
+        sample_rate=args.sample_rate,
+        engine=args.synth,
+    )
+    print(
+        "Rendered {:.1f}s of audio to {} in {:.1f}s ({:.1f}x real time)".format(
+            result.duration, args.output, result.elapsed, result.realtime_factor
+        )
+    )
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--canvas-keyboard",
+        action="store_true",
+        help="draw the keyboard as a single widget, faster on wide terminals",
+    )
+    parser.add_argument(
+        "--no-kitty-keyboard",
+        dest="kitty_keyboard",
+        action="store_false",
+        help="don't ask the terminal for key release events",
+    )
+    parser.add_argument(
+        "--play",
+        metavar="MIDI_FILE",
+        help="play a MIDI file, showing its notes on the keyboard",
+    )
+    parser.add_argument(
+        "--record",
+        metavar="MIDI_FILE",
+        help="record what is played, and save it to a MIDI file on exit",
+    )
+    parser.add_argument(
+        "--midi-in",
+        metavar="PATH",
+        help="play the raw MIDI bytes written to a named pipe or a Unix socket",
+    )
+    parser.add_argument(
+        "--osc-port",
+        type=int,
+        metavar="PORT",
+        help="play the OSC messages or raw MIDI bytes sent to this local UDP port",
+    )
+    parser.add_argument(
+        "--chord",
+        metavar="NAME",
+        help="play a chord with each key: major, minor, diminished, augmented,"
+        " sus4, 7, maj7, m7 or one given with --voicing",
+    )
+    parser.add_argument(
+        "--voicing",
+        action="append",
+        default=[],
+        metavar="NAME=INTERVALS",
+        help="add a chord, as semitones from the key played, such as"
+        " add9=0,4,7,14 (can be repeated)",
+    )
+    parser.add_argument(
+        "--latency-report",
+        metavar="FILE",
+        help="write a JSON report of the key-to-sound latency on exit",
+    )
+    parser.add_argument(
+        "--profile-startup",
+        action="store_true",
+        help="start up, quit once the synth is ready and print how long it took",
+    )
+
+    audio = parser.add_argument_group(
+        "audio output", "try --low-latency, or larger periods if the sound stutters"
+    )
+    audio.add_argument(
+        "--synth",
+        choices=["fluidsynth", "numpy"],
+        help="synthesizer, by default FluidSynth or the built-in one without it",
+    )
+    audio.add_argument(
+        "--audio-driver",
+        metavar="DRIVER",
+        help="fluidsynth audio driver, such as pulseaudio, pipewire, jack or alsa",
+    )
+    audio.add_argument(
+        "--sample-rate", dest="audio_sample_rate", type=int, metavar="HZ"
+    )
+    audio.add_argument(
+        "--period-size", type=int, metavar="FRAMES", help="frames per audio period"
+    )
+    audio.add_argument("--periods", type=int, help="number of audio periods")
+    audio.add_argument(
+        "--low-latency",
+        action="store_true",
+        help="use small audio buffers: 2 periods of 128 frames at 48000 Hz",
+    )
+    audio.add_argument(
+        "--auto-buffer",
+        action="store_true",
+        help="make the audio buffers larger when the synth can't keep up",
+    )
+
+    headless = parser.add_argument_group(
+        "headless mode", "play from the terminal with only the synth, without the UI"
+    )
+    headless.add_argument("--headless", action="store_true")
+    headless.add_argument(
+        "--instrument",
+        type=int,
+        default=0,
+        metavar="PROGRAM",
+        help="General MIDI program number, from 0 to 127",
+    )
+    headless.add_argument("--transpose", type=int, default=0, metavar="SEMITONES")
+    headless.add_argument("--octave", type=int, default=0)
+    headless.add_argument("--sustain", action="store_true")
+    headless.add_argument(
+        "--inversion", type=int, default=0, help="inversion of the --chord played"
+    )
+
+    subparsers = parser.add_subparsers(dest="command")
+    render_parser = subparsers.add_parser(
+        "render", help="render a MIDI file to a WAV file, faster than real time"
+    )
+    render_parser.add_argument("midi_file")
+    render_parser.add_argument("-o", "--output", required=True, help="WAV file")
+    render_parser.add_argument("--sample-rate", type=int, default=44100)
+    render_parser.add_argument(
+        "--soundfont", help="soundfont file, defaults to the bundled one"
+    )
+
+    args = parser.parse_args()
+    if args.midi_in == "-" and not args.headless:
+        parser.error("the terminal UI uses stdin, --midi-in - needs --headless")
+    if not args.headless:
+        given = [
+            "--" + name
+            for name in ("instrument", "transpose", "octave", "sustain", "inversion")
+            if getattr(args, name) != parser.get_default(name)
+        ]
+        if given:
+            parser.error(
+                "{} only apply with --headless, the UI has controls for them".format(
+                    ", ".join(given)
+                )
+            )
+    if not 0 <= args.instrument <= 127:
+        parser.error("--instrument must be between 0 and 127")
+    if not -11 <= args.transpose <= 11 or not -3 <= args.octave <= 3:
+        parser.error("--transpose goes from -11 to 11, --octave from -3 to 3")
+    if args.chord or args.voicing:
+        from upiano import chords
+
+        for voicing in args.voicing:
+            try:
+                chords.add_voicing(*chords.parse_voicing(voicing))
+            except ValueError as error:
+                parser.error("--voicing {}: {}".format(voicing, error))
+        if args.chord is not None and args.chord not in chords.CHORDS:
+            parser.error("--chord must be one of {}".format(", ".join(chords.CHORDS)))
+    if args.command == "render":
+        run_render(args)
+    else:
+        run_app(args)
+
+
+if __name__ == "__main__":
+    main()
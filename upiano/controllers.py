@@ -0,0 +1,100 @@
+"""
+Coalescing of continuous controller updates, such as the ones from sliders.
+"""
+from upiano.smf import CONTROL_CHANGE
+from upiano.smf import PITCH_BEND
+
+CHANNELS = 16
+# pitch bend is kept in the slot after the 128 control change numbers
+PITCH_BEND_SLOT = 128
+_SLOTS = 129
+
+_UNSET = -1
+
+
+class ControllerUpdates:
+    """
+    Buffers controller updates and sends them to the synth in batches.
+
+    Only the last value of each controller (per channel) is kept until the
+    next `flush`, and values equal to what the synth already has are not
+    sent again, so a slider being dragged costs at most one message per
+    flush, however many steps it went through.
+
+    `wakeup` is called when an update arrives with nothing pending, so that
+    whatever drives the flushes can be paused while there is nothing to do.
+    The messages sent are also sent to `recorder`, if given.
+    """
+
+    def __init__(self, synth, recorder=None):
+        self.synth = synth
+        self.recorder = recorder
+        self.wakeup = None
+        # received: updates given, coalesced: overwritten before being sent,
+        # skipped: same as the value already sent, sent: messages sent
+        self.received = 0
+        self.coalesced = 0
+        self.skipped = 0
+        self.sent = 0
+        self._pending = {}
+        self._values = [_UNSET] * (CHANNELS * _SLOTS)
+
+    def __len__(self):
+        return len(self._pending)
+
+    def control_change(self, control: int, value: int, channel: int = 0):
+        self._update(channel * _SLOTS + control, value)
+
+    def pitch_bend(self, value: int, channel: int = 0):
+        """
+        Bend the pitch, with `value` from -8192 to 8191 and 0 for no bend.
+        """
+        self._update(channel * _SLOTS + PITCH_BEND_SLOT, value + 8192)
+
+    def _update(self, slot: int, value: int):
+        self.received += 1
+        pending = self._pending
+        if slot in pending:
+            self.coalesced += 1
+        elif not pending and self.wakeup is not None:
+            self.wakeup()
+        pending[slot] = value
+
+    def value(self, control: int, channel: int = 0) -> int:
+        """
+        Return the last value sent for a controller, or -1 if none was.
+        """
+        return self._values[channel * _SLOTS + control]
+
+    def flush(self):
+        """
+        Send the pending updates to the synth.
+        """
+        if not self._pending:
+            return
+        pending = self._pending
+        self._pending = {}
+        values = self._values
+        for slot, value in pending.items():
+            if values[slot] == value:
+                self.skipped += 1
+                continue
+            values[slot] = value
+            self.sent += 1
+            channel, control = divmod(slot, _SLOTS)
+            if control == PITCH_BEND_SLOT:
+                status, data1, data2 = PITCH_BEND | channel, value & 0x7F, value >> 7
+                self.synth.send_message(status, data1, data2)
+            else:
+                status, data1, data2 = CONTROL_CHANGE | channel, control, value
+                self.synth.control_change(control, value, channel)
+            if self.recorder is not None:
+                self.recorder.record(status, data1, data2)
+
+    def stats(self):
+        return {
+            "received": self.received,
+            "sent": self.sent,
+            "coalesced": self.coalesced,
+            "skipped": self.skipped,
+        }
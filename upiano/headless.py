@@ -0,0 +1,420 @@
+"""
+Headless mode: the synth and the note pipeline, without the Textual UI.
+
+The computer keyboard is read from the raw terminal, and played through the
+same NotePipeline as the app, with no widget tree and no rendering at all.
+The other input sources (MIDI file, MIDI input, OSC) play as in the app.
+
+Besides the piano keys:
+
+- Up / Down: octave up / down
+- Right / Left: transpose up / down
+- Insert: toggle sustain
+- F8: panic, stops all the notes
+- Ctrl-C: quit
+"""
+import asyncio
+import os
+import re
+import signal
+import sys
+import termios
+import tty
+from codecs import getincrementaldecoder
+from time import monotonic
+
+from upiano import midi
+from upiano.audio import AudioMonitor
+from upiano.audio import make_settings
+from upiano.key_release import KeyReleaseDetector
+from upiano.keymap import KEYMAP_CHARACTER_TO_INDEX
+from upiano.keymap import key_midi_value
+from upiano.kitty_keyboard import CTRL
+from upiano.kitty_keyboard import POP_FLAGS
+from upiano.kitty_keyboard import PRESS
+from upiano.kitty_keyboard import PUSH_FLAGS
+from upiano.kitty_keyboard import QUERY_FLAGS
+from upiano.kitty_keyboard import RELEASE
+from upiano.kitty_keyboard import key_character
+from upiano.kitty_keyboard import parse_flags_reply
+from upiano.kitty_keyboard import parse_sequence
+from upiano.latency import MONITOR
+from upiano.midi_input import MidiInput
+from upiano.osc import OscServer
+from upiano.player import MidiFilePlayer
+from upiano.scheduler import TimerWheel
+
+# same as the app's
+NOTE_EVENTS_TICK = 0.01
+AUDIO_CHECK_INTERVAL = 1.0
+TRANSPOSE_RANGE = (-11, 11)
+OCTAVE_RANGE = (-3, 3)
+
+# a whole escape sequence, or a single character
+_re_token = re.compile(r"\x1b\[[0-9;:?<>=]*[ -/]*[@-~]|\x1bO.|.", re.DOTALL)
+# the start of an escape sequence, cut at the end of a read
+_re_partial = re.compile(r"\x1b(?:\[[0-9;:?<>=]*[ -/]*|O)\Z")
+
+_CTRL_C = "\x03"
+_CTRL_C_CODE = 99
+
+# the functional keys, by the number and final of their sequence
+_ACTIONS = {
+    (1, "A"): "octave_up",
+    (1, "B"): "octave_down",
+    (1, "C"): "transpose_up",
+    (1, "D"): "transpose_down",
+    (2, "~"): "toggle_sustain",
+    (19, "~"): "panic",
+}
+
+
+class HeadlessPiano:
+    """
+    Plays the keys typed in the terminal on a synth.
+
+    Input is given to `feed` as text: characters are key presses whose
+    releases are guessed from the auto-repeat, as in the app, until the
+    terminal reports supporting the kitty keyboard protocol, then key
+    presses and releases come as escape sequences.
+    """
+
+    def __init__(
+        self,
+        synth,
+        note_pipeline,
+        controllers,
+        write=None,
+        kitty_keyboard=True,
+        audio_monitor=None,
+    ):
+        self.synth = synth
+        self.note_pipeline = note_pipeline
+        self.controllers = controllers
+        self.write = write
+        self.kitty_keyboard = kitty_keyboard
+        self.audio_monitor = audio_monitor
+        self.settings = note_pipeline.settings
+        self.sustain = False
+        # whether the terminal reports key releases (kitty keyboard protocol)
+        self.key_states = False
+        self.flags_pushed = False
+        self.scheduler = TimerWheel(resolution=NOTE_EVENTS_TICK)
+        self.key_release = KeyReleaseDetector(
+            on_release=self.release_key, scheduler=self.scheduler
+        )
+        self.done = None
+        self._pending = ""
+
+    def press_key(self, key_index):
+        self.note_pipeline.note_on(key_midi_value(key_index))
+
+    def release_key(self, key_index):
+        self.note_pipeline.note_off(key_midi_value(key_index))
+
+    def feed(self, text, now=None):
+        """
+        Handle some terminal input, read at `now` on the monotonic clock.
+        """
+        if now is None:
+            now = monotonic()
+        text = self._pending + text
+        self._pending = ""
+        end = len(text)
+        partial = _re_partial.search(text)
+        if partial is not None and partial.end() - partial.start() > 1:
+            # a lone escape is the key, not the start of a sequence
+            self._pending = text[partial.start() :]
+            end = partial.start()
+        for token in _re_token.findall(text, 0, end):
+            if len(token) == 1:
+                self._handle_character(token, now)
+            elif token[1] == "O":
+                self._handle_key(1, 0, PRESS, token[2])
+            else:
+                self._handle_sequence(token, now)
+
+    def _handle_character(self, character, now):
+        if character == _CTRL_C:
+            self.quit()
+            return
+        key_index = KEYMAP_CHARACTER_TO_INDEX.get(character)
+        if key_index is not None and not self.key_states:
+            if self.key_release.key_event(key_index, now):
+                MONITOR.input_received(now)
+                self.press_key(key_index)
+
+    def _handle_sequence(self, sequence, now):
+        flags = parse_flags_reply(sequence)
+        if flags is not None:
+            self._enable_key_states()
+            return
+        parsed = parse_sequence(sequence)
+        if parsed is not None:
+            code, _, modifiers, event_type, final = parsed
+            if final == "u":
+                self._handle_code(code, modifiers, event_type, now)
+            else:
+                self._handle_key(code, modifiers, event_type, final)
+
+    def _handle_code(self, code, modifiers, event_type, now):
+        if code == _CTRL_C_CODE and modifiers & CTRL:
+            self.quit()
+            return
+        key_index = KEYMAP_CHARACTER_TO_INDEX.get(key_character(code, "u"))
+        if key_index is None:
+            return
+        if event_type == PRESS:
+            MONITOR.input_received(now)
+            self.press_key(key_index)
+        elif event_type == RELEASE:
+            self.release_key(key_index)
+
+    def _handle_key(self, code, modifiers, event_type, final):
+        action = _ACTIONS.get((code, final))
+        if action is not None and event_type != RELEASE:
+            getattr(self, "action_" + action)()
+
+    def _enable_key_states(self):
+        if not self.kitty_keyboard or self.key_states:
+            return
+        self.key_states = True
+        # stop guessing the releases of the keys being held
+        self.key_release.release_all()
+        if self.write is not None:
+            self.write(PUSH_FLAGS)
+            self.flags_pushed = True
+
+    def set_sustain(self, value):
+        self.sustain = value
+        # the pedal holds the notes of all the parts
+        for channel in self.note_pipeline.channels:
+            self.controllers.control_change(midi.SUSTAIN, 100 if value else 0, channel)
+        self.controllers.flush()
+
+    def action_octave_up(self):
+        self._change_setting("octave", 1, OCTAVE_RANGE)
+
+    def action_octave_down(self):
+        self._change_setting("octave", -1, OCTAVE_RANGE)
+
+    def action_transpose_up(self):
+        self._change_setting("transpose", 1, TRANSPOSE_RANGE)
+
+    def action_transpose_down(self):
+        self._change_setting("transpose", -1, TRANSPOSE_RANGE)
+
+    def _change_setting(self, name, step, bounds):
+        low, high = bounds
+        value = min(max(getattr(self.settings, name) + step, low), high)
+        getattr(self.note_pipeline, "set_" + name)(value)
+        self.show_status()
+
+    def action_toggle_sustain(self):
+        self.set_sustain(not self.sustain)
+        self.show_status()
+
+    def action_panic(self):
+        self.key_release.release_all()
+        self.note_pipeline.all_notes_off()
+        for channel in range(16):
+            # unlike All Notes Off, it also stops the sustained notes
+            self.synth.control_change(midi.ALL_SOUND_OFF, 0, channel)
+
+    def show_status(self):
+        if self.write is not None:
+            chord = ""
+            if self.settings.chord is not None:
+                chord = "  Chord {}/{}".format(
+                    self.settings.chord, self.settings.inversion
+                )
+            self.write(
+                "\rOctave {:+d}  Transpose {:+d}  Sustain {:3}{}\x1b[K".format(
+                    self.settings.octave,
+                    self.settings.transpose,
+                    "on" if self.sustain else "off",
+                    chord,
+                )
+            )
+
+    def quit(self):
+        if self.done is not None:
+            self.done.set()
+
+    def _advance_scheduler(self):
+        self.scheduler.advance()
+        if self.scheduler:
+            asyncio.get_running_loop().call_later(
+                NOTE_EVENTS_TICK, self._advance_scheduler
+            )
+
+    def _check_audio(self):
+        if self.audio_monitor.check():
+            print(
+                "\rThe audio was late, now using {}\x1b[K".format(
+                    self.audio_monitor.settings.describe()
+                ),
+                file=sys.stderr,
+            )
+            self.show_status()
+        asyncio.get_running_loop().call_later(AUDIO_CHECK_INTERVAL, self._check_audio)
+
+    def _wakeup(self):
+        asyncio.get_running_loop().call_later(NOTE_EVENTS_TICK, self._advance_scheduler)
+
+    async def run(self, midi_file=None, midi_in=None, osc_port=None):
+        """
+        Play until quit with Ctrl-C (or SIGTERM), or when not reading the
+        keyboard nor OSC, until the MIDI file and input are done.
+        """
+        loop = asyncio.get_running_loop()
+        self.done = asyncio.Event()
+        for signal_number in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signal_number, self.done.set)
+        self.scheduler.wakeup = self._wakeup
+        if self.audio_monitor is not None:
+            loop.call_later(AUDIO_CHECK_INTERVAL, self._check_audio)
+
+        player = MidiFilePlayer(self.synth, midi_file) if midi_file else None
+        midi_input = MidiInput(self.synth, midi_in) if midi_in else None
+        osc_server = OscServer(self.synth) if osc_port else None
+        try:
+            if player is not None:
+                player.start()
+            if midi_input is not None:
+                midi_input.start()
+            if osc_server is not None:
+                await osc_server.start(osc_port)
+            if midi_in != "-" and sys.stdin.isatty():
+                with raw_terminal(sys.stdin.fileno()):
+                    await self._read_keys(loop)
+            elif osc_server is not None:
+                await self.done.wait()
+            else:
+                while not self.done.is_set() and (
+                    (player is not None and player.playing)
+                    or (midi_input is not None and midi_input.running)
+                ):
+                    try:
+                        await asyncio.wait_for(self.done.wait(), 0.25)
+                    except asyncio.TimeoutError:
+                        pass
+        finally:
+            if osc_server is not None:
+                osc_server.stop()
+            if player is not None:
+                player.stop()
+                if player.error is not None:
+                    print(
+                        "upiano: can't play {}: {}".format(midi_file, player.error),
+                        file=sys.stderr,
+                    )
+            if midi_input is not None:
+                midi_input.stop()
+            self.action_panic()
+
+    async def _read_keys(self, loop):
+        fd = sys.stdin.fileno()
+        decode = getincrementaldecoder("utf-8")().decode
+        loop.add_reader(fd, lambda: self.feed(decode(os.read(fd, 1024))))
+        try:
+            if self.kitty_keyboard and self.write is not None:
+                # terminals without the protocol don't answer
+                self.write(QUERY_FLAGS)
+            self.show_status()
+            await self.done.wait()
+        finally:
+            loop.remove_reader(fd)
+            if self.flags_pushed:
+                self.write(POP_FLAGS)
+                self.flags_pushed = False
+            if self.write is not None:
+                self.write("\n")
+
+
+class raw_terminal:
+    """
+    Context manager turning off line buffering and echo on a terminal.
+    """
+
+    def __init__(self, fd):
+        self.fd = fd
+        self._attributes = None
+
+    def __enter__(self):
+        self._attributes = termios.tcgetattr(self.fd)
+        tty.setcbreak(self.fd)
+        return self
+
+    def __exit__(self, *exc_info):
+        termios.tcsetattr(self.fd, termios.TCSADRAIN, self._attributes)
+
+
+def _write_to_terminal(text):
+    sys.stdout.write(text)
+    sys.stdout.flush()
+
+
+def run_headless(args):
+    from upiano.controllers import ControllerUpdates
+    from upiano.note_pipeline import KeyboardPlayingSettings
+    from upiano.note_pipeline import NotePipeline
+    from upiano.recorder import PerformanceRecorder
+    from upiano.smf import PROGRAM_CHANGE
+
+    audio_settings = make_settings(
+        "low-latency" if args.low_latency else "default",
+        driver=args.audio_driver,
+        sample_rate=args.audio_sample_rate,
+        period_size=args.period_size,
+        periods=args.periods,
+    )
+    print("Loading soundfont...", file=sys.stderr)
+    synth = midi.create_synth(audio_settings=audio_settings, engine=args.synth)
+    if getattr(synth, "fallback_reason", None):
+        print(
+            "Using the built-in synthesizer: {}".format(synth.fallback_reason),
+            file=sys.stderr,
+        )
+    audio_monitor = AudioMonitor(synth, auto_adjust=args.auto_buffer)
+    MONITOR.startup_phase("sound_ready")
+    recorder = PerformanceRecorder()
+    if args.record:
+        recorder.start()
+    settings = KeyboardPlayingSettings(
+        octave=args.octave,
+        transpose=args.transpose,
+        chord=args.chord,
+        inversion=args.inversion,
+    )
+    note_pipeline = NotePipeline(synth, settings, recorder=recorder)
+    controllers = ControllerUpdates(synth, recorder=recorder)
+    synth.select_midi_program(args.instrument)
+    recorder.record(PROGRAM_CHANGE, args.instrument)
+
+    piano = HeadlessPiano(
+        synth,
+        note_pipeline,
+        controllers,
+        write=_write_to_terminal if sys.stdout.isatty() else None,
+        kitty_keyboard=args.kitty_keyboard,
+        audio_monitor=audio_monitor,
+    )
+    if args.sustain:
+        piano.set_sustain(True)
+    print(
+        "Playing {} ({}), Ctrl-C to quit".format(
+            midi.GENERAL_MIDI_INSTRUMENTS[args.instrument],
+            audio_monitor.settings.describe(),
+        ),
+        file=sys.stderr,
+    )
+    try:
+        asyncio.run(piano.run(args.play, args.midi_in, args.osc_port))
+    except OSError as error:
+        sys.exit("upiano: {}".format(error))
+
+    if args.record and len(recorder):
+        recorder.save(args.record)
+    if args.latency_report:
+        MONITOR.write_report(args.latency_report)
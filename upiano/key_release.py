@@ -0,0 +1,124 @@
+"""
+Key release emulation for terminals, which only report key presses.
+
+While a key is held down, the terminal repeats it: a first repeat comes
+after the auto-repeat delay, then more of them at the auto-repeat rate.
+So a key is considered released when its next repeat is overdue.
+"""
+from time import monotonic
+
+from upiano.scheduler import TimerWheel
+
+# Bounds for the gaps that are accepted as auto-repeat timings, anything
+# outside of them is more likely a key pressed again or a stalled app.
+MIN_REPEAT_DELAY = 0.1
+MAX_REPEAT_DELAY = 1.5
+MIN_REPEAT_INTERVAL = 0.005
+MAX_REPEAT_INTERVAL = 0.25
+
+# How much a new timing sample moves the learned value.
+LEARNING_RATE = 0.3
+
+# tag of the releases scheduled on a shared TimerWheel
+REPEAT = "repeat"
+
+
+def _learn(current: float, sample: float) -> float:
+    return current + (sample - current) * LEARNING_RATE
+
+
+class KeyReleaseDetector:
+    """
+    Detects key releases from the timing of the terminal's key repeats.
+
+    The auto-repeat delay and interval are learned from the incoming key
+    events, starting from common desktop defaults. Each held key has its
+    release scheduled for when its next repeat is overdue, and rescheduled
+    on every repeat.
+
+    Releases are scheduled on `scheduler`, which must be advanced
+    periodically (see `tick`). Times are taken from `clock`, unless given
+    explicitly.
+    """
+
+    def __init__(
+        self,
+        on_release,
+        repeat_delay=0.5,
+        repeat_interval=0.04,
+        tolerance=1.5,
+        scheduler=None,
+        clock=monotonic,
+    ):
+        self.on_release = on_release
+        self.repeat_delay = repeat_delay
+        self.repeat_interval = repeat_interval
+        self.tolerance = tolerance
+        self.clock = clock
+        if scheduler is None:
+            scheduler = TimerWheel(clock=clock)
+        self.scheduler = scheduler
+        self._last_seen = {}
+        self._repeats = {}
+
+    @property
+    def held_keys(self):
+        return self._repeats.keys()
+
+    def key_event(self, key, now=None) -> bool:
+        """
+        Register a key event, returning True if it's a new key press and
+        False if it's an auto-repeat of a key being held.
+        """
+        if now is None:
+            now = self.clock()
+        last_seen = self._last_seen.get(key)
+        if last_seen is None:
+            self._press(key, now)
+            return True
+
+        gap = now - last_seen
+        repeats = self._repeats[key]
+        if repeats == 0:
+            if gap < self.repeat_delay / 2:
+                # too early to be an auto-repeat: the key was pressed again
+                self.release(key)
+                self._press(key, now)
+                return True
+            if MIN_REPEAT_DELAY <= gap <= MAX_REPEAT_DELAY:
+                self.repeat_delay = _learn(self.repeat_delay, gap)
+        elif MIN_REPEAT_INTERVAL <= gap <= MAX_REPEAT_INTERVAL:
+            self.repeat_interval = _learn(self.repeat_interval, gap)
+
+        self._last_seen[key] = now
+        self._repeats[key] = repeats + 1
+        self.scheduler.schedule(
+            (REPEAT, key), self.repeat_interval * self.tolerance, self._overdue, now
+        )
+        return False
+
+    def _press(self, key, now):
+        self._last_seen[key] = now
+        self._repeats[key] = 0
+        self.scheduler.schedule(
+            (REPEAT, key), self.repeat_delay * self.tolerance, self._overdue, now
+        )
+
+    def tick(self, now=None):
+        """
+        Release all the keys whose next repeat is overdue.
+        """
+        self.scheduler.advance(now)
+
+    def _overdue(self, entry):
+        self.release(entry[1])
+
+    def release(self, key):
+        if self._repeats.pop(key, None) is not None:
+            self.scheduler.cancel((REPEAT, key))
+            del self._last_seen[key]
+            self.on_release(key)
+
+    def release_all(self):
+        for key in list(self._repeats):
+            self.release(key)
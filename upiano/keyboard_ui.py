@@ -1,15 +1,18 @@
 from dataclasses import dataclass
-from functools import partial
 
 from textual.containers import Horizontal
-from textual.message import Message
-from textual.reactive import reactive
+from textual.geometry import Region
+from textual.strip import Strip
 from textual.widget import Widget
-from textual.widgets import Static
 
 from upiano import midi
-from upiano.note_render import render_lower_part_key
-from upiano.note_render import render_upper_part_key
+from upiano.keymap import key_midi_value
+from upiano.latency import MONITOR
+from upiano.note_pipeline import MIDI_NOTES
+from upiano.note_render import lower_part_key_image
+from upiano.note_render import prebuild_key_images
+from upiano.note_render import upper_part_key_image
+from upiano.scheduler import TimerWheel
 
 """
 ┌──┬───┬┬───┬──┬──┬───┬┬───┬┬───┬──┬──┬───┬┬───┬──┬──┬───┬┬───┬┬───┬──┐
@@ -33,91 +36,81 @@ from upiano.note_render import render_upper_part_key
 """
 
 
-KEYMAP_CHAR_TO_INDEX = {
-    "A": 0,
-    "W": 1,
-    "S": 2,
-    "E": 3,
-    "D": 4,
-    "F": 5,
-    "T": 6,
-    "G": 7,
-    "Y": 8,
-    "H": 9,
-    "U": 10,
-    "J": 11,
-    "K": 12,
-    "O": 13,
-    "L": 14,
-    "P": 15,
-    ";": 16,
-    "'": 17,
-}
+# Resolution of the scheduled note events, such as note releases
+NOTE_EVENTS_TICK = 0.01
 
+# Rows of the upper part of the keys (down to the black keys' bottom) and
+# of the lower part
+UPPER_PART_HEIGHT = 8
+LOWER_PART_HEIGHT = 5
 
-SCALE = ["C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B"]
+# Columns taken by an octave of keys, in both the upper and lower parts, and
+# by the right edge of the last key
+OCTAVE_WIDTH = 35
+RIGHT_EDGE_WIDTH = 1
+# Octaves of the MIDI range, the last one only going up to G9
+OCTAVES = (MIDI_NOTES + 11) // 12
+# Where the keyboard starts, as long as the octaves after it fit
+DEFAULT_FIRST_OCTAVE = key_midi_value(0) // 12
 
-NOTES = [f"{note}{octave}" for octave in [3, 4, 5, 6, 7] for note in SCALE]
 
-
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Key:
     note: str
     midi_value: int
-    position: int
-
-
-class KeyDown(Message):
-    def __init__(self, key: Key):
-        super().__init__()
-        self.key = key
-
 
-class KeyUp(Message):
-    def __init__(self, key: Key):
-        super().__init__()
-        self.key = key
 
+# All the keys of the MIDI range, shared by the keyboards
+KEYS = tuple(Key(midi.midi_to_note(value), value) for value in range(MIDI_NOTES))
 
-@dataclass
-class MouseStatus:
-    pressed: bool = False
-    black_key_pressed: bool = False
+NOTES = [key.note for key in KEYS]
 
 
-MOUSE_STATUS = MouseStatus()
-
-
-class KeyPartMouseMixin:
-    def on_mouse_down(self, event):
-        MOUSE_STATUS.pressed = True
-        MOUSE_STATUS.black_key_pressed = "#" in self.key.note
-        if event.button == 1:
-            self.post_message(KeyDown(self.key))
-            self.highlight = True
+class KeyPartImageMixin:
+    """
+    Draws a key part straight from a pre-rendered `KeyImage`, so that a
+    highlight change is only a cache lookup and a repaint.
 
-    def on_mouse_up(self, event):
-        MOUSE_STATUS.pressed = False
-        MOUSE_STATUS.black_key_pressed = False
-        if event.button == 1:
-            self.post_message(KeyUp(self.key))
-            self.highlight = False
+    The parts are reused when the keyboard scrolls or gets resized: they are
+    given another key with `show_key`, instead of being mounted again.
+    """
 
-    def on_leave(self, event):
-        self.highlight = False
-        self.post_message(KeyUp(self.key))
+    def __init__(self, key, first=False, last=False, highlight=False, **kwargs):
+        super().__init__(**kwargs)
+        self.key = key
+        self.first = first
+        self.last = last
+        self.highlight = highlight
+        self._image = self._get_image(highlight)
 
-    def on_enter(self, event):
-        if MOUSE_STATUS.pressed:
-            if MOUSE_STATUS.black_key_pressed and "#" not in self.key.note:
-                return
-            self.post_message(KeyDown(self.key))
-            self.highlight = True
+    def show_key(self, key, first, last, highlight):
+        width = self.get_content_width()
+        self.key = key
+        self.first = first
+        self.last = last
+        self.highlight = highlight
+        self._image = self._get_image(highlight)
+        self.refresh(layout=self.get_content_width() != width)
+
+    def set_highlight(self, value):
+        if value != self.highlight:
+            self.highlight = value
+            self._image = self._get_image(value)
+            self.refresh()
+
+    def render_line(self, y):
+        if y == 0:
+            MONITOR.key_drawn()
+        strips = self._image.strips
+        if y < len(strips):
+            return strips[y]
+        return Strip.blank(self.size.width, self.rich_style)
 
+    def get_content_height(self, *args, **kwargs):
+        return 8
 
-class KeyUpperPart(Static, KeyPartMouseMixin):
-    highlight = reactive(False)
 
+class KeyUpperPart(KeyPartImageMixin, Widget):
     DEFAULT_CSS = """
     KeyUpperPart {
         width: auto;
@@ -125,33 +118,20 @@ class KeyUpperPart(Static, KeyPartMouseMixin):
     }
     """
 
-    def __init__(self, key, **kwargs):
-        super().__init__(**kwargs)
-        self._content_width = 0
-        self.key = key
-        self.highlight = False
-
-    def watch_highlight(self, value):
-        rendered = render_upper_part_key(
+    def _get_image(self, highlight):
+        return upper_part_key_image(
             self.key.note,
-            first_corner=self.key.position == 0,
-            last_corner=self.key.position == len(NOTES) - 1,
+            first_corner=self.first,
+            last_corner=self.last,
             use_rich=True,
-            highlight=value,
+            highlight=highlight,
         )
-        self._content_width = len(rendered.splitlines()[0])
-        self.update(rendered)
-
-    def get_content_height(self, *args, **kwargs):
-        return 8
 
     def get_content_width(self, *args, **kwargs):
-        return self._content_width
-
+        return self._image.width
 
-class KeyLowerPart(Static, KeyPartMouseMixin):
-    highlight = reactive(False)
 
+class KeyLowerPart(KeyPartImageMixin, Widget):
     DEFAULT_CSS = """
     KeyLowerPart {
         width: auto;
@@ -159,76 +139,422 @@ class KeyLowerPart(Static, KeyPartMouseMixin):
     }
     """
 
-    def __init__(self, key, **kwargs):
-        super().__init__(**kwargs)
-        self.key = key
-        self.highlight = False
-
-    def watch_highlight(self, value):
-        self.update(
-            render_lower_part_key(
-                is_first=self.key.position == 0,
-                is_last=self.key.position == len(NOTES) - 1,
-                use_rich=True,
-                highlight=value,
-            )
+    def _get_image(self, highlight):
+        return lower_part_key_image(
+            is_first=self.first,
+            is_last=self.last,
+            use_rich=True,
+            highlight=highlight,
         )
 
-    def get_content_height(self, *args, **kwargs):
-        return 8
-
     def get_content_width(self, *args, **kwargs):
-        if self.key.position == len(NOTES) - 1:
-            return 6
-        return 0 if "#" in self.key.note else 5
+        return lower_part_width(self.key, self.last)
 
 
-class KeyboardWidget(Widget):
-    can_focus = True
+def lower_part_width(key: Key, last: bool) -> int:
+    if last:
+        return 6
+    return 0 if "#" in key.note else 5
 
-    DEFAULT_CSS = """
-    KeyboardWidget Horizontal {
-        height: 8;
-    }
+
+def octaves_fitting(width: int) -> int:
+    return (width - RIGHT_EDGE_WIDTH) // OCTAVE_WIDTH
+
+
+def single_key_value(midi_value: int) -> tuple[int, ...]:
+    return (midi_value,)
+
+
+class BaseKeyboardWidget(Widget):
     """
+    Note handling shared by the keyboard renderers, which only differ in
+    how they draw the keys and receive mouse input.
 
-    def __init__(self, note_on, note_off, **kwargs):
-        super().__init__(**kwargs)
-        self.virtual_keys: list[Key] = [
-            Key(note, midi.note_to_midi(note), index)
-            for index, note in enumerate(NOTES)
-        ]
+    The keyboard covers the whole MIDI range, but only shows the octaves
+    that fit in its width, and draws only those: `show_keys` gets called
+    with the visible keys when the keyboard is resized or scrolled.
+
+    The mouse is handled here for the whole keyboard, with a table of the
+    key under each cell of the layout: a mouse move is a lookup in it, and
+    the synth only gets called when the key under a pressed button changes.
+
+    A key may play several notes, such as a chord: `key_values` gives the
+    note values to highlight for a key, and the ones lit by a press are
+    kept until its release, to turn off exactly those.
+    """
+
+    can_focus = True
 
-        self.note_upper_widgets = [KeyUpperPart(key) for key in self.virtual_keys]
-        self.note_lower_widgets = [KeyLowerPart(key) for key in self.virtual_keys]
+    def __init__(self, note_on, note_off, key_values=None, **kwargs):
+        super().__init__(**kwargs)
+        prebuild_key_images(use_rich=True)
+        self.virtual_keys: tuple[Key, ...] = KEYS
+        # set when the width is known
+        self.first_octave = DEFAULT_FIRST_OCTAVE
+        self.octave_count = 0
+        self.visible_keys: tuple[Key, ...] = ()
+        # how many times each key is highlighted, by the keys pressed and
+        # other sources, visible or not, to be drawn when scrolled to
+        self._highlighted = bytearray(MIDI_NOTES)
+        # the note values lit by each key pressed
+        self._lit: dict[int, tuple[int, ...]] = {}
+        # x of the parts of the visible keys, and the key under each cell
+        self._upper_x: list[int] = []
+        self._lower_x: list[int] = []
+        self._key_rows: list[list[Key]] = []
+        self._mouse_pressed = False
+        self._pressed_key: Key | None = None
+        self._black_key_pressed = False
         self.note_on = note_on
         self.note_off = note_off
+        self.key_values = key_values or single_key_value
+        self.scheduler = TimerWheel(resolution=NOTE_EVENTS_TICK)
 
-    def compose(self):
-        with Horizontal():
-            for w in self.note_upper_widgets:
-                yield w
-        with Horizontal():
-            for w in self.note_lower_widgets:
-                yield w
+    def on_mount(self):
+        self._scheduler_timer = self.set_interval(
+            NOTE_EVENTS_TICK, self._advance_scheduler, pause=not self.scheduler
+        )
+        self.scheduler.wakeup = self._scheduler_timer.resume
+
+    def _advance_scheduler(self):
+        self.scheduler.advance()
+        if not self.scheduler:
+            self._scheduler_timer.pause()
+
+    def on_resize(self, event):
+        self.show_octaves(self.first_octave, octaves_fitting(event.size.width))
+
+    def on_mouse_scroll_up(self, event):
+        self.scroll_octaves(1)
+
+    def on_mouse_scroll_down(self, event):
+        self.scroll_octaves(-1)
+
+    def scroll_octaves(self, delta: int):
+        self.show_octaves(self.first_octave + delta, self.octave_count)
+
+    def show_octaves(self, first_octave: int, octave_count: int):
+        """
+        Show `octave_count` octaves from `first_octave` (0 being the one of
+        C-1), as far as the MIDI range goes.
+        """
+        octave_count = max(1, min(octave_count, OCTAVES))
+        first_octave = max(0, min(first_octave, OCTAVES - octave_count))
+        if (first_octave, octave_count) == (self.first_octave, self.octave_count):
+            return
+        self.first_octave = first_octave
+        self.octave_count = octave_count
+        first = first_octave * 12
+        self.visible_keys = self.virtual_keys[first : first + octave_count * 12]
+        self._layout_keys(self.visible_keys)
+        self.show_keys(self.visible_keys)
+
+    def _layout_keys(self, keys):
+        upper_columns = []
+        lower_columns = []
+        self._upper_x.clear()
+        self._lower_x.clear()
+        last = len(keys) - 1
+        for index, key in enumerate(keys):
+            self._upper_x.append(len(upper_columns))
+            width = upper_part_key_image(
+                key.note, index == 0, index == last, use_rich=True
+            ).width
+            upper_columns.extend([key] * width)
+            self._lower_x.append(len(lower_columns))
+            lower_columns.extend([key] * lower_part_width(key, index == last))
+        self._key_rows = [upper_columns] * UPPER_PART_HEIGHT + [
+            lower_columns
+        ] * LOWER_PART_HEIGHT
+
+    # drawing, done by the renderers: the base widget only keeps the state
+
+    def show_keys(self, keys: tuple[Key, ...]):
+        """
+        Draw the visible keys, with their highlights.
+        """
+
+    def draw_highlight(self, index: int, value: bool):
+        """
+        Draw the highlight of the visible key at `index`.
+        """
+
+    def draw_highlights(self, indexes: list[int], value: bool):
+        """
+        Draw the highlights of several visible keys.
+        """
+        for index in indexes:
+            self.draw_highlight(index, value)
+
+    def _count_highlight(self, midi_value: int, value: bool) -> bool:
+        # whether the key is lit or unlit by this
+        count = self._highlighted[midi_value]
+        if value:
+            self._highlighted[midi_value] = min(count + 1, 255)
+            return count == 0
+        self._highlighted[midi_value] = max(count - 1, 0)
+        return count == 1
+
+    def highlight_key(self, key: Key, value: bool):
+        if self._count_highlight(key.midi_value, value):
+            index = key.midi_value - self.first_octave * 12
+            if 0 <= index < len(self.visible_keys):
+                self.draw_highlight(index, value)
+
+    def highlight_keys(self, midi_values, value: bool):
+        """
+        Highlight the keys of several notes, drawing them all at once.
+        """
+        first = self.first_octave * 12
+        indexes = [
+            midi_value - first
+            for midi_value in midi_values
+            if self._count_highlight(midi_value, value)
+            and 0 <= midi_value - first < len(self.visible_keys)
+        ]
+        if indexes:
+            self.draw_highlights(indexes, value)
+
+    def is_highlighted(self, key: Key) -> bool:
+        return bool(self._highlighted[key.midi_value])
+
+    def highlight_midi_note(self, midi_value: int, value: bool):
+        """
+        Highlight the key of a note.
+        """
+        if 0 <= midi_value < MIDI_NOTES:
+            self.highlight_key(self.virtual_keys[midi_value], value)
 
     def handle_key_down(self, key: Key):
         self.note_on(key.midi_value)
-        self.note_upper_widgets[key.position].highlight = True
-        self.note_lower_widgets[key.position].highlight = True
+        if key.midi_value not in self._lit:
+            values = self.key_values(key.midi_value)
+            self._lit[key.midi_value] = values
+            self.highlight_keys(values, True)
 
     def handle_key_up(self, key: Key):
         self.note_off(key.midi_value)
-        self.note_upper_widgets[key.position].highlight = False
-        self.note_lower_widgets[key.position].highlight = False
+        values = self._lit.pop(key.midi_value, None)
+        if values is not None:
+            self.highlight_keys(values, False)
+
+    def press_key(self, key_index):
+        self.handle_key_down(self.virtual_keys[key_midi_value(key_index)])
+
+    def release_key(self, key_index):
+        self.handle_key_up(self.virtual_keys[key_midi_value(key_index)])
+
+    def release_all_keys(self):
+        """
+        Release every key.
+        """
+        for key in self.virtual_keys:
+            self.handle_key_up(key)
+
+    def key_at(self, x: int, y: int) -> Key | None:
+        if 0 <= y < len(self._key_rows):
+            columns = self._key_rows[y]
+            if 0 <= x < len(columns):
+                return columns[x]
+        return None
+
+    def _mouse_key(self, event) -> Key | None:
+        # from screen coordinates, since the mouse down events come from the
+        # key parts of KeyboardWidget
+        region = self.content_region
+        return self.key_at(event.screen_x - region.x, event.screen_y - region.y)
+
+    def _press(self, key: Key):
+        self._pressed_key = key
+        self.handle_key_down(key)
+
+    def _release(self):
+        if self._pressed_key is not None:
+            self.handle_key_up(self._pressed_key)
+            self._pressed_key = None
+
+    def on_mouse_down(self, event):
+        if event.button != 1:
+            return
+        key = self._mouse_key(event)
+        if key is not None:
+            MONITOR.input_received(event.time)
+            self._mouse_pressed = True
+            self._black_key_pressed = "#" in key.note
+            self._press(key)
+            # so that the moves over the key parts, and the button release
+            # wherever it happens, come here (Textual takes the release to
+            # focus the widget, if it isn't yet)
+            self.capture_mouse()
+            self.focus()
+
+    def on_mouse_up(self, event):
+        if event.button == 1 and self._mouse_pressed:
+            self._release()
+            self._mouse_pressed = False
+            self._black_key_pressed = False
+            self.release_mouse()
+
+    def on_mouse_move(self, event):
+        if not self._mouse_pressed:
+            return
+        key = self._mouse_key(event)
+        if key is self._pressed_key:
+            return
+        self._release()
+        if key is None:
+            return
+        if self._black_key_pressed and "#" not in key.note:
+            return
+        self._press(key)
+
+    def on_leave(self, event):
+        self._release()
+
+
+class KeyboardWidget(BaseKeyboardWidget):
+    """
+    The keyboard made of a widget per key part, for the visible keys only.
+    Scrolling gives the parts other keys, more parts get mounted when the
+    keyboard gets wider, and the ones left over are hidden.
+    """
 
-    def on_key_down(self, event):
-        self.handle_key_down(event.key)
+    DEFAULT_CSS = """
+    KeyboardWidget Horizontal {
+        height: 8;
+    }
+    """
+
+    def __init__(self, note_on, note_off, **kwargs):
+        super().__init__(note_on, note_off, **kwargs)
+        self.note_upper_widgets: list[KeyUpperPart] = []
+        self.note_lower_widgets: list[KeyLowerPart] = []
+        self._upper_row = Horizontal()
+        self._lower_row = Horizontal()
+
+    def compose(self):
+        yield self._upper_row
+        yield self._lower_row
+
+    def show_keys(self, keys):
+        self._show_parts(self.note_upper_widgets, self._upper_row, KeyUpperPart, keys)
+        self._show_parts(self.note_lower_widgets, self._lower_row, KeyLowerPart, keys)
+
+    def _show_parts(self, parts, row, part_class, keys):
+        last = len(keys) - 1
+        new_parts = []
+        for index, key in enumerate(keys):
+            highlight = self.is_highlighted(key)
+            if index < len(parts):
+                parts[index].show_key(key, index == 0, index == last, highlight)
+                parts[index].display = True
+            else:
+                new_parts.append(part_class(key, index == 0, index == last, highlight))
+        for part in parts[len(keys) :]:
+            part.display = False
+        if new_parts:
+            parts.extend(new_parts)
+            row.mount(*new_parts)
+
+    def draw_highlight(self, index, value):
+        self.note_upper_widgets[index].set_highlight(value)
+        self.note_lower_widgets[index].set_highlight(value)
+
+
+class KeyboardCanvas(BaseKeyboardWidget):
+    """
+    The whole keyboard drawn as a single widget.
+
+    Every line of the visible keys is kept pre-rendered in a framebuffer,
+    built from the cached key images when the keyboard is resized or
+    scrolled. A highlight change splices the key image into the affected
+    lines and repaints only the columns of that key, or of all the keys of
+    a chord in a single refresh.
+    """
+
+    def __init__(self, note_on, note_off, **kwargs):
+        super().__init__(note_on, note_off, **kwargs)
+        self._lines: list[Strip] = []
+
+    def show_keys(self, keys):
+        upper_images = []
+        lower_images = []
+        for index, key in enumerate(keys):
+            highlight = self.is_highlighted(key)
+            upper_images.append(self._upper_image(index, highlight))
+            width = self._lower_width(index)
+            lower_images.append((self._lower_image(index, highlight), width))
+
+        self._lines.clear()
+        for y in range(UPPER_PART_HEIGHT):
+            self._lines.append(Strip.join(image.strips[y] for image in upper_images))
+        for y in range(LOWER_PART_HEIGHT):
+            self._lines.append(
+                Strip.join(
+                    image.strips[y].crop(0, width) for image, width in lower_images
+                )
+            )
+        self.refresh()
 
-    def on_key_up(self, event):
-        self.handle_key_up(event.key)
+    def _upper_image(self, index: int, highlight: bool):
+        return upper_part_key_image(
+            self.visible_keys[index].note,
+            first_corner=index == 0,
+            last_corner=index == len(self.visible_keys) - 1,
+            use_rich=True,
+            highlight=highlight,
+        )
+
+    def _lower_image(self, index: int, highlight: bool):
+        return lower_part_key_image(
+            is_first=index == 0,
+            is_last=index == len(self.visible_keys) - 1,
+            use_rich=True,
+            highlight=highlight,
+        )
+
+    def _lower_width(self, index: int):
+        return lower_part_width(
+            self.visible_keys[index], index == len(self.visible_keys) - 1
+        )
 
-    def play_key(self, key_index):
-        virtual_key = self.virtual_keys[key_index]
-        self.handle_key_down(virtual_key)
-        self.set_timer(0.3, partial(self.handle_key_up, virtual_key))
+    def _blit(self, y: int, x: int, strip: Strip):
+        line = self._lines[y]
+        parts = [line.crop(0, x), strip]
+        end = x + strip.cell_length
+        # cropping from the very end still returns the last cell
+        if end < line.cell_length:
+            parts.append(line.crop(end))
+        self._lines[y] = Strip.join(parts)
+
+    def _draw_key(self, index: int, value: bool, regions: list[Region]):
+        upper = self._upper_image(index, value)
+        x = self._upper_x[index]
+        for y, strip in enumerate(upper.strips):
+            self._blit(y, x, strip)
+        regions.append(Region(x, 0, upper.width, UPPER_PART_HEIGHT))
+
+        width = self._lower_width(index)
+        if width:
+            lower = self._lower_image(index, value)
+            x = self._lower_x[index]
+            for y, strip in enumerate(lower.strips):
+                self._blit(UPPER_PART_HEIGHT + y, x, strip.crop(0, width))
+            regions.append(Region(x, UPPER_PART_HEIGHT, width, lower.height))
+
+    def draw_highlight(self, index, value):
+        self.draw_highlights((index,), value)
+
+    def draw_highlights(self, indexes, value):
+        regions = []
+        for index in indexes:
+            self._draw_key(index, value, regions)
+        self.refresh(*regions)
+
+    def render_line(self, y):
+        if y == 0:
+            MONITOR.key_drawn()
+        if y < len(self._lines):
+            # blanking the rest of the line, where wider views were drawn
+            return self._lines[y].extend_cell_length(self.size.width, self.rich_style)
+        return Strip.blank(self.size.width, self.rich_style)
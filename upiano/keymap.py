@@ -0,0 +1,43 @@
+"""
+Mapping of the computer keyboard to the notes of the piano.
+"""
+from upiano.midi import note_to_midi
+
+KEYMAP_CHAR_TO_INDEX = {
+    "A": 0,
+    "W": 1,
+    "S": 2,
+    "E": 3,
+    "D": 4,
+    "F": 5,
+    "T": 6,
+    "G": 7,
+    "Y": 8,
+    "H": 9,
+    "U": 10,
+    "J": 11,
+    "K": 12,
+    "O": 13,
+    "L": 14,
+    "P": 15,
+    ";": 16,
+    "'": 17,
+}
+
+# Same keymap, looked up by the character typed in either case, so that
+# handling a key press doesn't need to build a new string.
+KEYMAP_CHARACTER_TO_INDEX = {
+    **{char.lower(): index for char, index in KEYMAP_CHAR_TO_INDEX.items()},
+    **KEYMAP_CHAR_TO_INDEX,
+}
+
+
+# the note of the first key of the keymap
+FIRST_KEY_NOTE = "C3"
+
+
+def key_midi_value(index: int) -> int:
+    """
+    Return the MIDI note of the piano key at `index`, before transposition.
+    """
+    return note_to_midi(FIRST_KEY_NOTE) + index
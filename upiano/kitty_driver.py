@@ -0,0 +1,135 @@
+"""
+Terminal driver using the kitty keyboard protocol, for Linux and MacOS.
+
+It asks the terminal whether it supports the protocol, turns the
+enhancements on if it does, and parses the key sequences into regular key
+events plus KeyStateChange events. On other terminals nothing changes.
+"""
+import os
+import selectors
+from codecs import getincrementaldecoder
+
+from textual import events
+from textual import log
+from textual._xterm_parser import XTermParser
+from textual.drivers.linux_driver import LinuxDriver
+
+from upiano.kitty_keyboard import POP_FLAGS
+from upiano.kitty_keyboard import PRIVATE_USE_CODES
+from upiano.kitty_keyboard import PUSH_FLAGS
+from upiano.kitty_keyboard import QUERY_FLAGS
+from upiano.kitty_keyboard import RELEASE
+from upiano.kitty_keyboard import key_character
+from upiano.kitty_keyboard import legacy_sequence
+from upiano.kitty_keyboard import parse_flags_reply
+from upiano.kitty_keyboard import parse_sequence
+
+
+class KeyStateChange(events.Event):
+    """
+    A key was pressed, repeated or released.
+
+    `character` is the unshifted character of the key, if it has one, so
+    that it's the same for the press and the release whatever modifiers
+    changed in between.
+    """
+
+    def __init__(self, key: str, character, event_type: int):
+        super().__init__()
+        self.key = key
+        self.character = character
+        self.event_type = event_type
+
+
+class KeyboardProtocolSupported(events.Event):
+    """
+    The terminal supports the kitty keyboard protocol.
+    """
+
+    def __init__(self, flags: int):
+        super().__init__()
+        self.flags = flags
+
+
+class KittyXTermParser(XTermParser):
+    """
+    XTermParser that also understands the kitty keyboard protocol.
+    """
+
+    def _sequence_to_key_events(self, sequence, *args, **kwargs):
+        if not sequence.startswith("\x1b[") or len(sequence) < 3:
+            yield from super()._sequence_to_key_events(sequence, *args, **kwargs)
+            return
+        flags = parse_flags_reply(sequence)
+        if flags is not None:
+            yield KeyboardProtocolSupported(flags)
+            return
+        parsed = parse_sequence(sequence)
+        if parsed is None:
+            yield from super()._sequence_to_key_events(sequence, *args, **kwargs)
+            return
+
+        code, shifted_code, modifiers, event_type, final = parsed
+        if final == "u" and code >= PRIVATE_USE_CODES:
+            # modifiers and other keys without a legacy sequence
+            yield KeyStateChange("unknown", None, event_type)
+            return
+        legacy = legacy_sequence(code, shifted_code, modifiers, final)
+        key_events = list(super()._sequence_to_key_events(legacy, *args, **kwargs))
+        key = key_events[0].key if key_events else "unknown"
+        yield KeyStateChange(key, key_character(code, final), event_type)
+        if event_type != RELEASE:
+            yield from key_events
+
+
+class KittyKeyboardDriver(LinuxDriver):
+    """
+    LinuxDriver that turns the kitty keyboard protocol on, if the terminal
+    supports it.
+    """
+
+    _flags_pushed = False
+
+    def start_application_mode(self):
+        super().start_application_mode()
+        # terminals without the protocol don't answer
+        self.write(QUERY_FLAGS)
+        self.flush()
+
+    def stop_application_mode(self):
+        if self._flags_pushed:
+            self.write(POP_FLAGS)
+            self.flush()
+            self._flags_pushed = False
+        super().stop_application_mode()
+
+    def run_input_thread(self):
+        """
+        Same as LinuxDriver's, with the parser for the protocol.
+        """
+        selector = selectors.DefaultSelector()
+        selector.register(self.fileno, selectors.EVENT_READ)
+        fileno = self.fileno
+
+        def more_data():
+            for _key, selector_events in selector.select(0.01):
+                if selector_events:
+                    return True
+            return False
+
+        feed = KittyXTermParser(more_data, self._debug).feed
+        decode = getincrementaldecoder("utf-8")().decode
+        try:
+            while not self.exit_event.is_set():
+                for _key, mask in selector.select(0.1):
+                    if mask & selectors.EVENT_READ:
+                        for event in feed(decode(os.read(fileno, 1024))):
+                            if isinstance(event, KeyboardProtocolSupported):
+                                self.write(PUSH_FLAGS)
+                                self.flush()
+                                self._flags_pushed = True
+                            self.process_event(event)
+        except Exception as error:
+            log(error)
+        finally:
+            selector.close()
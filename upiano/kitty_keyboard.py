@@ -0,0 +1,104 @@
+"""
+Real key press and release events, with the kitty keyboard protocol.
+
+Terminals implementing the protocol's progressive enhancements report keys
+as escape sequences with their event type (press, repeat or release):
+
+    CSI key-code[:shifted-key] ; modifiers[:event-type] u
+
+(or the legacy CSI sequence of the functional keys, with the event type).
+Here is the parsing of the sequences, without anything Textual: the app's
+driver is in kitty_driver, and the headless mode uses it as well.
+
+See https://sw.kovidgoyal.net/kitty/keyboard-protocol/
+"""
+import re
+
+PRESS = 1
+REPEAT = 2
+RELEASE = 3
+
+# disambiguate escape codes, report event types, report alternate keys,
+# and report all keys as escape codes (or letters would come as text,
+# without releases)
+FLAGS = 1 | 2 | 4 | 8
+
+QUERY_FLAGS = "\x1b[?u"
+PUSH_FLAGS = "\x1b[>%du" % FLAGS
+POP_FLAGS = "\x1b[<u"
+
+SHIFT = 1
+CTRL = 4
+
+_re_flags_reply = re.compile(r"\x1b\[\?(\d+)u\Z")
+_re_key = re.compile(
+    r"\x1b\[(\d*)(?::(\d*))?(?::\d*)?(?:;(\d*)(?::(\d))?)?(?:;[\d:]*)?([u~A-DFHPQRS])\Z"
+)
+
+# the keys reported with a code, and the legacy sequence they stand for
+_LEGACY_CODES = {9: "\t", 13: "\r", 27: "\x1b", 127: "\x7f"}
+# codes from here on are the protocol's own, for keys like the modifiers
+PRIVATE_USE_CODES = 57344
+
+
+def parse_flags_reply(sequence: str):
+    """
+    Return the flags of a reply to QUERY_FLAGS, or None if it isn't one.
+    """
+    match = _re_flags_reply.match(sequence)
+    return None if match is None else int(match.group(1))
+
+
+def parse_sequence(sequence: str):
+    """
+    Parse a key escape sequence of the protocol, returning (code,
+    shifted_code, modifiers, event_type, final) or None if it isn't one.
+
+    `code` is the key code (or the number of a legacy sequence),
+    `modifiers` is the bitmask of the protocol, without its 1 offset.
+    """
+    match = _re_key.match(sequence)
+    if match is None:
+        return None
+    code, shifted_code, modifiers, event_type, final = match.groups()
+    return (
+        int(code or 1),
+        int(shifted_code) if shifted_code else None,
+        int(modifiers or 1) - 1,
+        int(event_type or PRESS),
+        final,
+    )
+
+
+def legacy_sequence(code, shifted_code, modifiers, final):
+    """
+    Return the sequence the key would send without the protocol, which is
+    what Textual knows how to turn into a key event.
+    """
+    if final == "u":
+        if code in _LEGACY_CODES:
+            if code == 9 and modifiers & SHIFT:
+                return "\x1b[Z"
+            return _LEGACY_CODES[code]
+        character = chr(code)
+        if modifiers & SHIFT:
+            character = chr(shifted_code) if shifted_code else character.upper()
+        if modifiers & CTRL and character.isalpha():
+            return chr(ord(character.lower()) & 0x1F)
+        return character
+    if modifiers:
+        return "\x1b[%d;%d%s" % (code, modifiers + 1, final)
+    if final == "~":
+        return "\x1b[%d~" % code
+    if final in "PQRS":
+        return "\x1bO" + final
+    return "\x1b[" + final
+
+
+def key_character(code, final):
+    """
+    Return the unshifted character of a key, or None if it has none.
+    """
+    if final == "u" and code not in _LEGACY_CODES and code < PRIVATE_USE_CODES:
+        return chr(code)
+    return None
@@ -0,0 +1,175 @@
+"""
+Latency instrumentation for the path from an input event to the sound.
+
+Each stage of the path is timed against the monotonic clock (the same one
+Textual uses for event timestamps) and recorded in a histogram:
+
+- queue: from the input event being created to the app handling it
+- synth: from the app handling the event to the synth call returning
+- repaint: from the app handling the event to the key being redrawn
+
+It also keeps how long the startup phases took, such as the time to the
+first frame and to the synth being able to play.
+"""
+import json
+from time import monotonic
+from time import perf_counter
+
+STAGES = ("queue", "synth", "repaint")
+
+# Sub-buckets per power of two: values are kept with ~3% precision.
+_SUB_BUCKET_BITS = 5
+_SUB_BUCKETS = 1 << _SUB_BUCKET_BITS
+# Enough buckets for durations up to half an hour, in microseconds.
+_BUCKET_COUNT = (32 - _SUB_BUCKET_BITS) * _SUB_BUCKETS
+
+
+def _bucket_index(value: int) -> int:
+    if value < 2 * _SUB_BUCKETS:
+        return value
+    exponent = value.bit_length() - _SUB_BUCKET_BITS - 1
+    return min(exponent * _SUB_BUCKETS + (value >> exponent), _BUCKET_COUNT - 1)
+
+
+def _bucket_value(index: int) -> int:
+    if index < 2 * _SUB_BUCKETS:
+        return index
+    exponent = index // _SUB_BUCKETS - 1
+    return (index % _SUB_BUCKETS + _SUB_BUCKETS) << exponent
+
+
+class LatencyHistogram:
+    """
+    HDR-style histogram of durations in microseconds.
+
+    Buckets are linear within each power of two, so recording is a few
+    integer operations and memory doesn't depend on the number of samples.
+    """
+
+    def __init__(self):
+        self.counts = [0] * _BUCKET_COUNT
+        self.count = 0
+        self.total = 0
+        self.min = 0
+        self.max = 0
+
+    def record(self, value: int):
+        if value < 0:
+            value = 0
+        self.counts[_bucket_index(value)] += 1
+        if not self.count or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        self.count += 1
+        self.total += value
+
+    def percentile(self, percent: float) -> int:
+        if not self.count:
+            return 0
+        threshold = self.count * percent / 100
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= threshold:
+                return min(_bucket_value(index), self.max)
+        return self.max
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "min": self.min,
+            "max": self.max,
+            "mean": round(self.mean, 1),
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "p99.9": self.percentile(99.9),
+            "buckets": [
+                [_bucket_value(index), count]
+                for index, count in enumerate(self.counts)
+                if count
+            ],
+        }
+
+
+class LatencyMonitor:
+    """
+    Keeps a histogram per stage for the latest input event.
+    """
+
+    def __init__(self):
+        self.histograms = {stage: LatencyHistogram() for stage in STAGES}
+        self._input_time = 0.0
+        self._synth_pending = False
+        self._repaint_pending = False
+        self.startup = {}
+        self._startup_began = perf_counter()
+
+    def begin_startup(self, at: float = None):
+        self.startup.clear()
+        self._startup_began = perf_counter() if at is None else at
+
+    def startup_phase(self, name: str, at: float = None):
+        """
+        Record that a startup phase got done, now or at the given
+        `perf_counter` time, in milliseconds since the startup began.
+        """
+        if at is None:
+            at = perf_counter()
+        self.startup[name] = round((at - self._startup_began) * 1000, 1)
+
+    def input_received(self, event_time: float):
+        """
+        Call when an input event that plays a note gets handled.
+        """
+        now = monotonic()
+        self.histograms["queue"].record(int((now - event_time) * 1_000_000))
+        self._input_time = now
+        self._synth_pending = True
+        self._repaint_pending = True
+
+    def note_sent(self):
+        """
+        Call after a note on has been sent to the synthesizer.
+        """
+        if self._synth_pending:
+            self._synth_pending = False
+            self.histograms["synth"].record(
+                int((monotonic() - self._input_time) * 1_000_000)
+            )
+
+    def key_drawn(self):
+        """
+        Call when a key gets redrawn.
+        """
+        if self._repaint_pending:
+            self._repaint_pending = False
+            self.histograms["repaint"].record(
+                int((monotonic() - self._input_time) * 1_000_000)
+            )
+
+    def summary(self):
+        return {
+            stage: (histogram.percentile(50), histogram.percentile(99))
+            for stage, histogram in self.histograms.items()
+        }
+
+    def write_report(self, path: str):
+        report = {
+            "startup_ms": self.startup,
+            "unit": "us",
+            "stages": {
+                stage: histogram.to_dict()
+                for stage, histogram in self.histograms.items()
+            },
+        }
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+MONITOR = LatencyMonitor()
@@ -3,10 +3,11 @@ from functools import partial
 
 import urwid
 
-from upiano.note_render import render_lower_part_key
-from upiano.note_render import render_upper_part_key
+from upiano.note_render import lower_part_key_image
+from upiano.note_render import upper_part_key_image
 from upiano.piano import NOTE_MAP
 from upiano.piano import play_note
+from upiano.piano import stop_notes
 
 """
 This is what we're gonna builddddd....
@@ -38,9 +39,9 @@ class NoteUpperWidget(urwid.WidgetWrap):
         self.text.set_text(self._build_text(highlight=highlight))
 
     def _build_text(self, highlight=False):
-        return render_upper_part_key(
+        return upper_part_key_image(
             self.note, self.first_corner, self.last_corner, highlight=highlight
-        )
+        ).text
 
 
 class NoteBottomWidget(urwid.WidgetWrap):
@@ -53,11 +54,11 @@ class NoteBottomWidget(urwid.WidgetWrap):
         self.text.set_text(self._build_text(highlight=highlight))
 
     def _build_text(self, highlight=False):
-        return render_lower_part_key(
+        return lower_part_key_image(
             is_first=self.which == "first",
             is_last=self.which == "last",
             highlight=highlight,
-        )
+        ).text
 
 
 class KeyboardWidget(urwid.WidgetWrap):
@@ -143,4 +144,7 @@ if __name__ == "__main__":
     asyncio_loop = asyncio.get_event_loop()
     evl = urwid.AsyncioEventLoop(loop=asyncio_loop)
     urwid_loop = urwid.MainLoop(widget, event_loop=evl, unhandled_input=handle_key)
-    urwid_loop.run()
+    try:
+        urwid_loop.run()
+    finally:
+        stop_notes()
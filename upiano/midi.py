@@ -1,14 +1,26 @@
 """
 MidiSynth class for playing midi notes.
 """
+import ctypes
 import os
+import threading
+import time
 
-import fluidsynth
+from upiano.audio import AudioSettings
 
 SOUNDFONTS_DIR = os.path.join(os.path.dirname(__file__), "soundfonts")
 
 DEFAULT_SOUND_FONT = "GeneralUser_GS_v1.471.sf2"
 
+# MIDI control change numbers
+VOLUME = 7
+SUSTAIN = 64
+REVERB = 91
+CHORUS = 93
+ALL_SOUND_OFF = 120
+
+NOTE_NAMES = ["C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B"]
+
 GENERAL_MIDI_INSTRUMENTS = [
     "Acoustic Grand Piano",
     "Bright Acoustic Piano",
@@ -172,16 +184,65 @@ def note_to_midi(note: str) -> int:
     60
     >>> note_to_midi("C#4")
     61
+    >>> note_to_midi("C-1")
+    0
     """
-    octave = int(note[-1])
     is_sharp = note[1] == "#"
+    octave = int(note[1 + is_sharp :])
     return 12 * (octave + 1) + "C D EF G A B".index(note[:1]) + int(is_sharp)
 
 
+def midi_to_note(midi_value: int) -> str:
+    """
+    Convert a midi note value to a note string.
+    >>> midi_to_note(61)
+    'C#4'
+    >>> midi_to_note(0)
+    'C-1'
+    """
+    return NOTE_NAMES[midi_value % 12] + str(midi_value // 12 - 1)
+
+
+def _cpu_load_function(fluidsynth):
+    # not wrapped by pyfluidsynth, and only its recent versions have cfunc
+    cfunc = getattr(fluidsynth, "cfunc", None)
+    if cfunc is None:
+        return None
+    return cfunc(
+        "fluid_synth_get_cpu_load", ctypes.c_double, ("synth", ctypes.c_void_p, 1)
+    )
+
+
 class MidiSynth:
-    def __init__(self, soundfont_name=None):
-        self.synthesizer = fluidsynth.Synth()
-        self.synthesizer.start()
+    def __init__(
+        self,
+        soundfont_name=None,
+        sample_rate=44100,
+        start_audio=True,
+        audio_settings=None,
+    ):
+        """
+        With `start_audio` set to False, no audio driver is started and the
+        samples are pulled with `get_samples` instead. Otherwise the audio
+        output is configured by `audio_settings`, whose sample rate then
+        replaces `sample_rate`.
+        """
+        # imported here since loading libfluidsynth is slow, and this way it
+        # happens in the thread creating the synth
+        import fluidsynth
+
+        if audio_settings is None:
+            audio_settings = AudioSettings(sample_rate=sample_rate)
+        self._audio_settings = audio_settings
+        self._pipewire_quantum = None
+        self.sample_rate = audio_settings.sample_rate
+        self.synthesizer = fluidsynth.Synth(
+            samplerate=self.sample_rate, **audio_settings.fluidsynth_settings()
+        )
+        self._cpu_load = _cpu_load_function(fluidsynth)
+        if start_audio:
+            self._set_pipewire_quantum(audio_settings)
+            self.synthesizer.start(driver=audio_settings.driver)
         self.soundfont_id = self.load_soundfont(soundfont_name or DEFAULT_SOUND_FONT)
         self.select_midi_program(0)
 
@@ -203,14 +264,261 @@ class MidiSynth:
     def note_off(self, note_value, channel=0):
         self.synthesizer.noteoff(channel, note_value)
 
+    def notes_on(self, notes, velocity=100):
+        """
+        Start several notes at once, given as (note_value, channel) pairs.
+        """
+        noteon = self.synthesizer.noteon
+        for note_value, channel in notes:
+            noteon(channel, note_value, velocity)
+
+    def notes_off(self, notes):
+        noteoff = self.synthesizer.noteoff
+        for note_value, channel in notes:
+            noteoff(channel, note_value)
+
+    def control_change(self, control, value, channel=0):
+        self.synthesizer.cc(channel, control, value)
+
     def set_sustain(self, value, channel=0):
-        self.synthesizer.cc(channel, 64, value)
+        self.synthesizer.cc(channel, SUSTAIN, value)
 
     def set_volume(self, value, channel=0):
-        self.synthesizer.cc(channel, 7, value)
+        self.synthesizer.cc(channel, VOLUME, value)
 
     def set_chorus(self, value, channel=0):
-        self.synthesizer.cc(channel, 93, value)
+        self.synthesizer.cc(channel, CHORUS, value)
 
     def set_reverb(self, value, channel=0):
-        self.synthesizer.cc(channel, 91, value)
+        self.synthesizer.cc(channel, REVERB, value)
+
+    def send_message(self, status, data1, data2=0):
+        """
+        Play a raw MIDI channel message.
+        """
+        kind = status & 0xF0
+        channel = status & 0x0F
+        if kind == 0x90 and data2:
+            self.synthesizer.noteon(channel, data1, data2)
+        elif kind in (0x80, 0x90):
+            self.synthesizer.noteoff(channel, data1)
+        elif kind == 0xB0:
+            self.synthesizer.cc(channel, data1, data2)
+        elif kind == 0xC0:
+            # unlike select_midi_program, this picks the drum kits on channel 10
+            self.synthesizer.program_change(channel, data1)
+        elif kind == 0xE0:
+            self.synthesizer.pitch_bend(channel, (data1 | data2 << 7) - 8192)
+
+    def send_messages(self, messages):
+        """
+        Play several (status, data1, data2) messages in a row.
+        """
+        send_message = self.send_message
+        for status, data1, data2 in messages:
+            send_message(status, data1, data2)
+
+    def audio_settings(self):
+        """
+        Return the settings of the audio output, as fluidsynth applied them.
+        """
+        get_setting = getattr(self.synthesizer, "get_setting", None)
+        if get_setting is None:
+            # older pyfluidsynth versions can't read the settings back
+            return self._audio_settings
+        return AudioSettings(
+            driver=get_setting("audio.driver"),
+            sample_rate=self.sample_rate,
+            period_size=get_setting("audio.period-size"),
+            periods=get_setting("audio.periods"),
+        )
+
+    def restart_audio(self, audio_settings):
+        """
+        Restart the audio driver with new period settings (the sample rate
+        and driver can't change).
+        """
+        import fluidsynth
+
+        fluidsynth.delete_fluid_audio_driver(self.synthesizer.audio_driver)
+        for name, value in audio_settings.fluidsynth_settings().items():
+            self.synthesizer.setting(name, value)
+        self._audio_settings = audio_settings
+        self._set_pipewire_quantum(audio_settings)
+        self.synthesizer.audio_driver = fluidsynth.new_fluid_audio_driver(
+            self.synthesizer.settings, self.synthesizer.synth
+        )
+
+    def _set_pipewire_quantum(self, audio_settings):
+        # PipeWire picks its own buffer size for the stream, unless told to
+        # follow the period size (but a quantum set by the user wins)
+        if audio_settings.period_size is None:
+            return
+        current = os.environ.get("PIPEWIRE_QUANTUM")
+        if current is not None and current != self._pipewire_quantum:
+            return
+        self._pipewire_quantum = "{}/{}".format(
+            audio_settings.period_size, audio_settings.sample_rate
+        )
+        os.environ["PIPEWIRE_QUANTUM"] = self._pipewire_quantum
+
+    def cpu_load(self):
+        """
+        Return the CPU load of the synth in percent of real time, or None
+        if it can't be known.
+        """
+        if self._cpu_load is None:
+            return None
+        return self._cpu_load(self.synthesizer.synth)
+
+    def get_samples(self, frames):
+        """
+        Render the next `frames` frames of audio, as interleaved 16-bit stereo.
+        """
+        return self.synthesizer.get_samples(frames)
+
+
+def create_synth(*args, engine=None, **kwargs):
+    """
+    Create a MidiSynth, or a SoftSynth if `engine` is "numpy" or if
+    FluidSynth isn't available (and NumPy is).
+    """
+    if engine != "numpy":
+        try:
+            return MidiSynth(*args, **kwargs)
+        except (ImportError, OSError) as error:
+            if engine == "fluidsynth":
+                raise
+            fallback_reason = str(error)
+            try:
+                from upiano.softsynth import SoftSynth
+            except ImportError:
+                raise error from None
+            synth = SoftSynth(*args, **kwargs)
+            synth.fallback_reason = fallback_reason
+            return synth
+
+    from upiano.softsynth import SoftSynth
+
+    return SoftSynth(*args, **kwargs)
+
+
+class BackgroundMidiSynth:
+    """
+    A synth (see `create_synth`) that gets created on a worker thread, since
+    starting the audio driver and loading the soundfont can take a while.
+
+    Until the synth is ready, notes are dropped (and counted in
+    `dropped_notes`) while the other calls are queued and replayed once it
+    is. When ready, the calls go straight to the MidiSynth methods, without
+    any overhead. If creating the synth fails, the exception is kept in
+    `error`.
+    """
+
+    _METHODS = [
+        "note_on",
+        "note_off",
+        "notes_on",
+        "notes_off",
+        "send_message",
+        "send_messages",
+        "select_midi_program",
+        "control_change",
+        "set_sustain",
+        "set_volume",
+        "set_chorus",
+        "set_reverb",
+    ]
+
+    def __init__(self, *args, **kwargs):
+        self.synth = None
+        self.error = None
+        self.dropped_notes = 0
+        self.ready_at = None
+        self._pending = []
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._thread = threading.Thread(
+            target=self._load, args=args, kwargs=kwargs, daemon=True
+        )
+        self._thread.start()
+
+    @property
+    def ready(self):
+        return self.synth is not None
+
+    @property
+    def loading(self):
+        return not self._ready.is_set()
+
+    def wait(self, timeout=None):
+        """
+        Wait until the synth is ready or failed to load.
+        """
+        return self._ready.wait(timeout)
+
+    def _load(self, *args, **kwargs):
+        try:
+            synth = create_synth(*args, **kwargs)
+        except Exception as error:
+            self.error = error
+            self._ready.set()
+            return
+
+        with self._lock:
+            for name, call_args, call_kwargs in self._pending:
+                getattr(synth, name)(*call_args, **call_kwargs)
+            self._pending.clear()
+            for name in self._METHODS:
+                setattr(self, name, getattr(synth, name))
+            self.synth = synth
+        self.ready_at = time.perf_counter()
+        self._ready.set()
+
+    def _call(self, name, args, kwargs, defer):
+        with self._lock:
+            if self.synth is None:
+                if defer:
+                    self._pending.append((name, args, kwargs))
+                elif name == "note_on":
+                    self.dropped_notes += 1
+                elif name == "notes_on":
+                    self.dropped_notes += len(args[0])
+                return
+        getattr(self.synth, name)(*args, **kwargs)
+
+    def note_on(self, *args, **kwargs):
+        self._call("note_on", args, kwargs, defer=False)
+
+    def note_off(self, *args, **kwargs):
+        self._call("note_off", args, kwargs, defer=False)
+
+    def notes_on(self, *args, **kwargs):
+        self._call("notes_on", args, kwargs, defer=False)
+
+    def notes_off(self, *args, **kwargs):
+        self._call("notes_off", args, kwargs, defer=False)
+
+    def send_message(self, *args, **kwargs):
+        self._call("send_message", args, kwargs, defer=False)
+
+    def send_messages(self, *args, **kwargs):
+        self._call("send_messages", args, kwargs, defer=False)
+
+    def select_midi_program(self, *args, **kwargs):
+        self._call("select_midi_program", args, kwargs, defer=True)
+
+    def control_change(self, *args, **kwargs):
+        self._call("control_change", args, kwargs, defer=True)
+
+    def set_sustain(self, *args, **kwargs):
+        self._call("set_sustain", args, kwargs, defer=True)
+
+    def set_volume(self, *args, **kwargs):
+        self._call("set_volume", args, kwargs, defer=True)
+
+    def set_chorus(self, *args, **kwargs):
+        self._call("set_chorus", args, kwargs, defer=True)
+
+    def set_reverb(self, *args, **kwargs):
+        self._call("set_reverb", args, kwargs, defer=True)
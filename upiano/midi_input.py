@@ -0,0 +1,174 @@
+"""
+Raw MIDI input, read from a named pipe, a Unix socket or stdin.
+"""
+import os
+import re
+import select
+import socket
+import stat
+import sys
+import threading
+
+from upiano import smf
+from upiano.player import PlayedNotes
+
+# a status byte, or a run of data bytes
+_TOKENS = re.compile(rb"([\x80-\xff])|([\x00-\x7f]+)")
+
+_SYSEX = 0xF0
+_REALTIME = 0xF8
+# data bytes of the system common messages, which cancel the running status
+_SYSTEM_COMMON_LENGTHS = {0xF1: 1, 0xF2: 2, 0xF3: 1}
+
+_READ_SIZE = 4096
+# how often the reader thread checks whether it was stopped
+_POLL_INTERVAL = 0.25
+
+
+class MidiStreamParser:
+    """
+    Incremental parser for a raw MIDI byte stream, with running status.
+
+    Bytes can be fed in chunks of any size: messages split across chunks
+    are completed by the next ones. Channel messages are passed to
+    `on_message(status, data1, data2)`; system and real time messages are
+    skipped. Chunks are split with a regex into status bytes and runs of
+    data bytes, and a run is sliced into messages, so the Python work is
+    per message rather than per byte.
+    """
+
+    def __init__(self, on_message):
+        self.on_message = on_message
+        self.status = 0
+        self._length = 0
+        # data bytes of the message being parsed
+        self._partial = b""
+        # data bytes left to skip, for system messages
+        self._skip = 0
+        self._in_sysex = False
+
+    def feed(self, data: bytes):
+        on_message = self.on_message
+        for status_token, data_token in _TOKENS.findall(data):
+            if status_token:
+                byte = status_token[0]
+                if byte >= _REALTIME:
+                    # can come anywhere, even inside another message
+                    continue
+                self._in_sysex = byte == _SYSEX
+                self._partial = b""
+                if byte < _SYSEX:
+                    self.status = byte
+                    self._length = smf.DATA_LENGTHS[byte & 0xF0]
+                    self._skip = 0
+                else:
+                    self.status = 0
+                    self._skip = _SYSTEM_COMMON_LENGTHS.get(byte, 0)
+                continue
+
+            if self._in_sysex:
+                continue
+            if self._skip:
+                skipped = min(self._skip, len(data_token))
+                self._skip -= skipped
+                data_token = data_token[skipped:]
+            if not self.status or not data_token:
+                continue
+
+            run = self._partial + data_token if self._partial else data_token
+            status = self.status
+            length = self._length
+            end = len(run) - len(run) % length
+            if length == 2:
+                for index in range(0, end, 2):
+                    on_message(status, run[index], run[index + 1])
+            else:
+                for index in range(end):
+                    on_message(status, run[index], 0)
+            self._partial = run[end:]
+
+
+class MidiInput:
+    """
+    Plays the MIDI messages read from `path` on a synth, from a dedicated
+    thread.
+
+    `path` can be a named pipe, which is kept open so that programs can
+    write to it one after the other, a Unix stream socket to connect to,
+    or "-" for stdin. The messages go straight to the synth, and the notes
+    are counted in `played_notes` for the UI to show, as with
+    MidiFilePlayer.
+    """
+
+    def __init__(self, synth, path):
+        self.synth = synth
+        self.path = path
+        self.played_notes = PlayedNotes()
+        self.messages_received = 0
+        self.parser = MidiStreamParser(self.play_message)
+        self._stop = threading.Event()
+        self._thread = None
+        self._fd = None
+        self._resources = []
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """
+        Open the input, raising OSError if that fails, and start reading.
+        """
+        self._fd, self._resources = self._open()
+        self._thread = threading.Thread(target=self.run, name="midi-in", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def play_message(self, status, data1, data2):
+        self.messages_received += 1
+        self.synth.send_message(status, data1, data2)
+        self.played_notes.update(status, data1, data2)
+
+    def _open(self):
+        """
+        Return the file descriptor to read from, and what to close when done.
+        """
+        if self.path == "-":
+            return sys.stdin.buffer.fileno(), []
+        mode = os.stat(self.path).st_mode
+        if stat.S_ISSOCK(mode):
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(self.path)
+            return sock.fileno(), [sock]
+        fd = os.open(self.path, os.O_RDONLY | os.O_NONBLOCK)
+        if stat.S_ISFIFO(mode):
+            # holding a write end keeps the pipe from hitting end of file
+            # when a writer goes away, so that the next one can take over
+            return fd, [os.open(self.path, os.O_WRONLY | os.O_NONBLOCK), fd]
+        return fd, [fd]
+
+    def run(self):
+        fd = self._fd
+        feed = self.parser.feed
+        try:
+            while not self._stop.is_set():
+                readable, _, _ = select.select([fd], [], [], _POLL_INTERVAL)
+                if not readable:
+                    continue
+                try:
+                    data = os.read(fd, _READ_SIZE)
+                except BlockingIOError:
+                    continue
+                if not data:
+                    break
+                feed(data)
+        finally:
+            for resource in self._resources:
+                if isinstance(resource, int):
+                    os.close(resource)
+                else:
+                    resource.close()
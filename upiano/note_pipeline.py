@@ -0,0 +1,277 @@
+"""
+Turns the notes played on the keyboard into synthesizer calls.
+"""
+from dataclasses import dataclass
+
+from upiano.chords import chord_intervals
+from upiano.latency import MONITOR
+from upiano.smf import NOTE_OFF
+from upiano.smf import NOTE_ON
+
+MIDI_NOTES = 128
+CHANNELS = 16
+
+# keyboard modes
+SINGLE = "single"
+SPLIT = "split"
+LAYER = "layer"
+
+# channels of the parts of the keyboard: the main part is the whole keyboard
+# or its upper side, the second one is its lower side or the layered sound
+MAIN_CHANNEL = 0
+SECOND_CHANNEL = 1
+
+
+@dataclass(frozen=True)
+class Zone:
+    """
+    A range of keyboard note values, played on a MIDI channel.
+    """
+
+    channel: int
+    low: int = 0
+    high: int = MIDI_NOTES - 1
+
+
+@dataclass
+class KeyboardPlayingSettings:
+    octave: int = 0
+    transpose: int = 0
+    mode: str = SINGLE
+    # first note value of the main part, when splitting the keyboard
+    split_point: int = 60
+    # chord played by each key (see upiano.chords), None for single notes
+    chord: str = None
+    inversion: int = 0
+
+    def zones(self):
+        if self.mode == SPLIT:
+            return (
+                Zone(SECOND_CHANNEL, high=self.split_point - 1),
+                Zone(MAIN_CHANNEL, low=self.split_point),
+            )
+        if self.mode == LAYER:
+            return (Zone(MAIN_CHANNEL), Zone(SECOND_CHANNEL))
+        return (Zone(MAIN_CHANNEL),)
+
+
+class ActiveNotes:
+    """
+    The notes sounding on each channel, kept as a 128-bit set per channel,
+    along with how many keys hold each of them.
+    """
+
+    def __init__(self):
+        self._bits = [0] * CHANNELS
+        self._holders = bytearray(CHANNELS * MIDI_NOTES)
+
+    def __len__(self):
+        return sum(bits.bit_count() for bits in self._bits)
+
+    def __iter__(self):
+        """
+        Yield the sounding notes as (pitch, channel).
+        """
+        for channel, bits in enumerate(self._bits):
+            while bits:
+                pitch = bits.bit_length() - 1
+                bits ^= 1 << pitch
+                yield pitch, channel
+
+    def is_active(self, pitch: int, channel: int = 0) -> bool:
+        return bool(self._bits[channel] >> pitch & 1)
+
+    def holders(self, pitch: int, channel: int = 0) -> int:
+        return self._holders[channel << 7 | pitch]
+
+    def start(self, notes):
+        """
+        Hold (pitch, channel) notes, returning the ones that weren't
+        sounding yet.
+        """
+        holders = self._holders
+        all_started = True
+        for pitch, channel in notes:
+            index = channel << 7 | pitch
+            count = holders[index]
+            holders[index] = count + 1
+            if count:
+                all_started = False
+            else:
+                self._bits[channel] |= 1 << pitch
+        if all_started:
+            return notes
+        # some were already sounding, held by other keys
+        return tuple(
+            (pitch, channel)
+            for pitch, channel in notes
+            if holders[channel << 7 | pitch] == 1
+        )
+
+    def stop(self, notes):
+        """
+        Let go of (pitch, channel) notes, returning the ones that nothing
+        holds anymore.
+        """
+        holders = self._holders
+        all_stopped = True
+        for pitch, channel in notes:
+            index = channel << 7 | pitch
+            count = holders[index]
+            if count == 1:
+                holders[index] = 0
+                self._bits[channel] &= ~(1 << pitch)
+            else:
+                all_stopped = False
+                if count:
+                    holders[index] = count - 1
+        if all_stopped:
+            return notes
+        return tuple(
+            (pitch, channel)
+            for pitch, channel in notes
+            if not holders[channel << 7 | pitch]
+        )
+
+    def clear(self):
+        self._bits = [0] * CHANNELS
+        self._holders = bytearray(CHANNELS * MIDI_NOTES)
+
+
+class NotePipeline:
+    """
+    Plays keyboard note values on a synth, applying transpose and octave.
+
+    Each note value is mapped to the notes it plays, as (pitch, channel)
+    pairs, according to the zones of the keyboard: one note normally, one
+    per layered channel, none when out of range. With a chord set, a key
+    plays the notes of the chord built on it, in the zone of the key. The
+    mapping is kept in a table that is only rebuilt when the settings
+    change, so playing a key is a list lookup and a single call into the
+    synth for all its notes, without allocating anything, however many
+    channels and chord notes are in use.
+
+    The notes a key started are kept until it's released, so the release
+    stops them even if the settings changed meanwhile. Notes already
+    sounding are not started again, and releasing a key that isn't playing
+    does nothing. The sounding notes are tracked in `active`.
+
+    The notes played are also sent to `recorder`, if given.
+    """
+
+    def __init__(self, synth, settings=None, velocity=100, recorder=None):
+        self.synth = synth
+        self.recorder = recorder
+        self.settings = settings or KeyboardPlayingSettings()
+        self.velocity = velocity
+        self.zones = ()
+        self.active = ActiveNotes()
+        self._notes = [()] * MIDI_NOTES
+        self._key_values = [()] * MIDI_NOTES
+        # the notes started by each key being held
+        self._sounding = [()] * MIDI_NOTES
+        self.rebuild()
+
+    def rebuild(self):
+        offset = self.settings.transpose + self.settings.octave * 12
+        intervals = chord_intervals(self.settings.chord, self.settings.inversion)
+        self.zones = self.settings.zones()
+        self._key_values = [
+            tuple(
+                note + interval
+                for interval in intervals
+                if 0 <= note + interval < MIDI_NOTES
+            )
+            for note in range(MIDI_NOTES)
+        ]
+        self._notes = [
+            tuple(
+                (value + offset, zone.channel)
+                for zone in self.zones
+                if zone.low <= note <= zone.high
+                for value in self._key_values[note]
+                if 0 <= value + offset < MIDI_NOTES
+            )
+            for note in range(MIDI_NOTES)
+        ]
+
+    @property
+    def channels(self):
+        return [zone.channel for zone in self.zones]
+
+    def set_transpose(self, value: int):
+        self.settings.transpose = value
+        self.rebuild()
+
+    def set_octave(self, value: int):
+        self.settings.octave = value
+        self.rebuild()
+
+    def set_mode(self, mode: str):
+        self.settings.mode = mode
+        self.rebuild()
+
+    def set_split_point(self, note_value: int):
+        self.settings.split_point = note_value
+        self.rebuild()
+
+    def set_chord(self, chord: str | None):
+        self.settings.chord = chord
+        self.rebuild()
+
+    def set_inversion(self, value: int):
+        self.settings.inversion = value
+        self.rebuild()
+
+    def key_values(self, note_value: int):
+        """
+        Return the note values played by a key, before transposition: the
+        key's own, or the ones of its chord.
+        """
+        return self._key_values[note_value]
+
+    def notes(self, note_value: int):
+        """
+        Return the (pitch, channel) notes played by a note value.
+        """
+        return self._notes[note_value]
+
+    def note_on(self, note_value: int):
+        if self._sounding[note_value]:
+            return
+        notes = self._notes[note_value]
+        if not notes:
+            return
+        self._sounding[note_value] = notes
+        notes = self.active.start(notes)
+        if notes:
+            self.synth.notes_on(notes, self.velocity)
+            MONITOR.note_sent()
+            if self.recorder is not None:
+                for pitch, channel in notes:
+                    self.recorder.record(NOTE_ON | channel, pitch, self.velocity)
+
+    def note_off(self, note_value: int):
+        notes = self._sounding[note_value]
+        if not notes:
+            return
+        self._sounding[note_value] = ()
+        notes = self.active.stop(notes)
+        if notes:
+            self.synth.notes_off(notes)
+            if self.recorder is not None:
+                for pitch, channel in notes:
+                    self.recorder.record(NOTE_OFF | channel, pitch, 0)
+
+    def all_notes_off(self):
+        """
+        Stop all the notes started by the keyboard.
+        """
+        notes = tuple(self.active)
+        self.active.clear()
+        self._sounding = [()] * MIDI_NOTES
+        if notes:
+            self.synth.notes_off(notes)
+            if self.recorder is not None:
+                for pitch, channel in notes:
+                    self.recorder.record(NOTE_OFF | channel, pitch, 0)
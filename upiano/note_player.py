@@ -0,0 +1,99 @@
+"""
+Audio of the legacy front end: notes played for a given duration.
+
+The original version spawned a sox `play` process per note, which costs
+tens of milliseconds of process start and audio device opening per key
+press, and leaves one process running per sounding note. NotePlayer keeps
+a single audio process instead, fed by the built-in synth, which mixes the
+overlapping notes.
+"""
+import subprocess
+import threading
+
+from upiano.midi import note_to_midi
+from upiano.scheduler import TimerWheel
+
+DEFAULT_DURATION = 1.5
+# how often the releases of the notes are checked, while there are any
+RELEASE_TICK = 0.01
+
+
+def legacy_note_to_midi(note):
+    """
+    Convert a note name as given to sox to a midi note value: without an
+    octave, it's in the fourth one.
+    >>> legacy_note_to_midi("C#")
+    61
+    >>> legacy_note_to_midi("C5")
+    72
+    """
+    if not note[-1].isdigit():
+        note += "4"
+    return note_to_midi(note)
+
+
+def spawn_note(note="C", duration=DEFAULT_DURATION, vol=1, verbose=False):
+    """
+    Play a note with a new sox process, the way it was done originally.
+    """
+    # requires sox to be installed: http://sox.sf.net
+    fadeout_len = duration / 2.0
+    command = (
+        "play -qn synth {duration} pluck {note}"
+        " fade l 0 {duration} {fadeout_len} reverb vol {vol}"
+    ).format(note=note, duration=duration, fadeout_len=fadeout_len, vol=vol)
+
+    if verbose:
+        print(command)
+
+    return subprocess.Popen(command.split(), stderr=subprocess.DEVNULL)
+
+
+class NotePlayer:
+    """
+    Plays notes for a duration on a synth with a single audio output.
+
+    The notes are plucked strings, like sox's pluck, and are released after
+    their duration by a background thread, which only ticks while notes
+    are sounding. Playing a note again before its release extends it.
+    """
+
+    def __init__(self, synth=None):
+        if synth is None:
+            from upiano.softsynth import SoftSynth
+
+            synth = SoftSynth()
+        self.synth = synth
+        self.releases = TimerWheel()
+        self.releases.wakeup = self._wakeup
+        self._lock = threading.Lock()
+        self._pending = threading.Event()
+        self._stop = threading.Event()
+        threading.Thread(
+            target=self._release_notes, name="note-releases", daemon=True
+        ).start()
+
+    def play(self, note, duration=DEFAULT_DURATION, vol=1):
+        note_value = legacy_note_to_midi(note)
+        velocity = max(1, min(127, round(vol * 100)))
+        with self._lock:
+            self.synth.note_on(note_value, velocity=velocity)
+            self.releases.schedule(note_value, duration, self.synth.note_off)
+
+    def close(self):
+        self._stop.set()
+        self._pending.set()
+        self.synth.close()
+
+    def _wakeup(self):
+        self._pending.set()
+
+    def _release_notes(self):
+        while True:
+            self._pending.wait()
+            if self._stop.wait(RELEASE_TICK):
+                return
+            with self._lock:
+                self.releases.advance()
+                if not self.releases:
+                    self._pending.clear()
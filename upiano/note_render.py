@@ -1,4 +1,13 @@
 import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from rich.text import Text
+    from textual.strip import Strip
+
+NOTE_CLASSES = ["C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B"]
 
 
 def render_upper_part_key(
@@ -12,7 +21,7 @@ def render_upper_part_key(
     Return a list of strings that represent the note in the upper part of the
     piano keyboard.
     """
-    normalized_note = re.sub("[0-9]", "", note).upper()
+    normalized_note = re.sub("[-0-9]", "", note).upper()
 
     if normalized_note in ("C#", "D#", "F#", "G#", "A#"):
         filling = ("#" if highlight else "█") * 3
@@ -35,7 +44,9 @@ def render_upper_part_key(
             ]
         )
 
-    if normalized_note in ("D", "G", "A"):
+    # the top key of the MIDI range is a G: as the last key, it's drawn
+    # with its right edge like the white keys below
+    if normalized_note in ("D", "G", "A") and not last_corner:
         return "\n".join(
             [
                 "┬",
@@ -49,7 +60,7 @@ def render_upper_part_key(
             ]
         )
 
-    if normalized_note in ("C", "E", "F", "B"):
+    if normalized_note in ("C", "D", "E", "F", "G", "A", "B"):
         top_right = "┐" if last_corner else ""
         end_right = "│" if last_corner else ""
         bottom_left = "│" if normalized_note in ("C", "F") else "╯"
@@ -121,3 +132,117 @@ def render_lower_part_key(
             text = text.replace(" ", "#")
 
     return text
+
+
+@lru_cache(maxsize=None)
+def note_class(note: str) -> str:
+    """
+    Return the note without its octave, e.g. "C#" for "c#4" or "c#-1".
+    """
+    return re.sub("[-0-9]", "", note).upper()
+
+
+@dataclass(frozen=True)
+class KeyImage:
+    """
+    A key part rendered once and ready to be drawn by any of the front ends.
+
+    `text` is what the render functions return (markup when `use_rich` is
+    set), `rich_text` and `strips` are the pre-parsed versions of it for
+    Textual, which are only built for rich images.
+    """
+
+    text: str
+    width: int
+    height: int
+    rich_text: "Text | None" = None
+    strips: "tuple[Strip, ...] | None" = None
+
+
+@lru_cache(maxsize=None)
+def _console():
+    from io import StringIO
+
+    from rich.console import Console
+
+    return Console(file=StringIO(), legacy_windows=False)
+
+
+def _build_key_image(text: str, use_rich: bool) -> KeyImage:
+    if not use_rich:
+        lines = text.splitlines()
+        return KeyImage(text, width=len(lines[0]), height=len(lines))
+
+    from rich.text import Text
+    from textual.strip import Strip
+
+    rich_text = Text.from_markup(text)
+    console = _console()
+    strips = tuple(
+        Strip(list(line.render(console)), line.cell_len)
+        for line in rich_text.split("\n")
+    )
+    return KeyImage(
+        text,
+        width=strips[0].cell_length,
+        height=len(strips),
+        rich_text=rich_text,
+        strips=strips,
+    )
+
+
+def upper_part_key_image(
+    note,
+    first_corner: bool = False,
+    last_corner: bool = False,
+    highlight=False,
+    use_rich=False,
+) -> KeyImage:
+    """
+    Cached version of `render_upper_part_key`, keyed by the note class.
+    """
+    return _cached_upper_part_key_image(
+        note_class(note), first_corner, last_corner, highlight, use_rich
+    )
+
+
+@lru_cache(maxsize=None)
+def _cached_upper_part_key_image(note, first_corner, last_corner, highlight, use_rich):
+    text = render_upper_part_key(
+        note,
+        first_corner=first_corner,
+        last_corner=last_corner,
+        highlight=highlight,
+        use_rich=use_rich,
+    )
+    return _build_key_image(text, use_rich)
+
+
+@lru_cache(maxsize=None)
+def lower_part_key_image(
+    is_first=False, is_last=False, highlight=False, use_rich=False
+) -> KeyImage:
+    """
+    Cached version of `render_lower_part_key`.
+    """
+    text = render_lower_part_key(
+        is_first=is_first, is_last=is_last, highlight=highlight, use_rich=use_rich
+    )
+    return _build_key_image(text, use_rich)
+
+
+def prebuild_key_images(use_rich=False):
+    """
+    Render every possible key image upfront, so that drawing a key while
+    playing is only a cache lookup.
+    """
+    for note in NOTE_CLASSES:
+        for first_corner in (False, True):
+            for last_corner in (False, True):
+                for highlight in (False, True):
+                    upper_part_key_image(
+                        note, first_corner, last_corner, highlight, use_rich
+                    )
+    for is_first, is_last in ((False, False), (True, False), (False, True)):
+        for highlight in (False, True):
+            lower_part_key_image(is_first, is_last, highlight, use_rich)
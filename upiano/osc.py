@@ -0,0 +1,247 @@
+"""
+Control of the synth over UDP, with OSC messages or raw MIDI bytes.
+
+OSC messages, with an optional channel as last argument:
+
+- /note_on note velocity [channel]
+- /note_off note [channel]
+- /program program [channel]
+- /cc control value [channel]
+- /upiano/stats, answered with the packets, messages and errors counts
+
+Any datagram that isn't OSC is played as raw MIDI bytes.
+"""
+import asyncio
+import socket
+import struct
+
+from upiano import smf
+from upiano.midi_input import MidiStreamParser
+from upiano.player import PlayedNotes
+
+DEFAULT_HOST = "127.0.0.1"
+STATS_ADDRESS = "/upiano/stats"
+
+_BUNDLE = b"#bundle\x00"
+
+# how many more datagrams are read from the socket when one arrives, so
+# that a burst is handled in one go instead of an event loop turn each
+_DRAIN_LIMIT = 256
+_RECEIVE_BUFFER_SIZE = 1 << 22
+
+_ARGUMENT_FORMATS = {"i": "i", "f": "f", "h": "q", "d": "d"}
+# types without data
+_CONSTANT_TYPES = {"T": True, "F": False, "N": None, "I": None}
+
+
+class OscError(ValueError):
+    pass
+
+
+def _padded_end(end):
+    return (end + 4) & ~3
+
+
+def _read_string(data, offset):
+    end = data.index(b"\x00", offset)
+    return data[offset:end].decode(), _padded_end(end)
+
+
+def parse_message(data, offset=0, end=None):
+    """
+    Parse an OSC message, returning its address and arguments.
+    """
+    if end is None:
+        end = len(data)
+    try:
+        address, offset = _read_string(data, offset)
+        if offset >= end:
+            return address, []
+        type_tags, offset = _read_string(data, offset)
+        arguments = []
+        for tag in type_tags[1:]:
+            if tag in _ARGUMENT_FORMATS:
+                value_format = ">" + _ARGUMENT_FORMATS[tag]
+                (value,) = struct.unpack_from(value_format, data, offset)
+                offset += struct.calcsize(value_format)
+            elif tag == "s":
+                value, offset = _read_string(data, offset)
+            elif tag == "b":
+                (size,) = struct.unpack_from(">i", data, offset)
+                value = data[offset + 4 : offset + 4 + size]
+                offset = (offset + 4 + size + 3) & ~3
+            elif tag in _CONSTANT_TYPES:
+                value = _CONSTANT_TYPES[tag]
+            else:
+                raise OscError("Unsupported OSC type tag: %r" % tag)
+            arguments.append(value)
+    except (ValueError, UnicodeDecodeError, struct.error) as error:
+        raise OscError("Invalid OSC message") from error
+    return address, arguments
+
+
+def parse_packet(data):
+    """
+    Yield the (address, arguments) of the messages in an OSC packet, which
+    may be a bundle (whose time tag is ignored: messages are played as soon
+    as they arrive).
+    """
+    if data.startswith(_BUNDLE):
+        offset = len(_BUNDLE) + 8
+        while offset < len(data):
+            try:
+                (size,) = struct.unpack_from(">i", data, offset)
+            except struct.error as error:
+                raise OscError("Truncated OSC bundle") from error
+            offset += 4
+            if not 0 <= size <= len(data) - offset:
+                raise OscError("Invalid OSC bundle element size: %d" % size)
+            yield from parse_packet(data[offset : offset + size])
+            offset += size
+    else:
+        yield parse_message(data)
+
+
+def _pad(data):
+    return data + b"\x00" * (4 - len(data) % 4)
+
+
+def encode_message(address, *arguments):
+    """
+    Encode an OSC message with int, float and str arguments.
+    """
+    type_tags = ","
+    encoded = b""
+    for argument in arguments:
+        if isinstance(argument, int):
+            type_tags += "i"
+            encoded += struct.pack(">i", argument)
+        elif isinstance(argument, float):
+            type_tags += "f"
+            encoded += struct.pack(">f", argument)
+        else:
+            type_tags += "s"
+            encoded += _pad(str(argument).encode())
+    return _pad(address.encode()) + _pad(type_tags.encode()) + encoded
+
+
+def _channel(arguments, index):
+    return int(arguments[index]) & 0x0F if len(arguments) > index else 0
+
+
+class OscServer(asyncio.DatagramProtocol):
+    """
+    Plays the messages received on a UDP port on a synth.
+
+    It runs on the event loop it's started from, which is the app's loop.
+    When a datagram arrives, the ones queued behind it are read right away,
+    and the messages are collected and sent to the synth in one
+    `send_messages` batch per loop iteration rather than one call per
+    datagram. Notes are counted in `played_notes` for the UI to show, as
+    with MidiFilePlayer.
+    """
+
+    def __init__(self, synth):
+        self.synth = synth
+        self.played_notes = PlayedNotes()
+        self.packets = 0
+        self.messages = 0
+        self.errors = 0
+        self.transport = None
+        self._socket = None
+        self._batch = []
+        self._flush_scheduled = False
+        self._midi_parser = MidiStreamParser(self._add_message)
+
+    async def start(self, port, host=DEFAULT_HOST):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            # the system may cap it, but the bigger the fewer drops on bursts
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, _RECEIVE_BUFFER_SIZE)
+            sock.bind((host, port))
+            sock.setblocking(False)
+        except OSError:
+            sock.close()
+            raise
+        self._socket = sock
+        loop = asyncio.get_running_loop()
+        await loop.create_datagram_endpoint(lambda: self, sock=sock)
+
+    def stop(self):
+        if self.transport is not None:
+            self.transport.close()
+            self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self._handle_packet(data, addr)
+        if self._socket is not None:
+            recvfrom = self._socket.recvfrom
+            for _ in range(_DRAIN_LIMIT):
+                try:
+                    data, addr = recvfrom(65536)
+                except OSError:
+                    break
+                self._handle_packet(data, addr)
+        if self._batch and not self._flush_scheduled:
+            self._flush_scheduled = True
+            asyncio.get_running_loop().call_soon(self.flush)
+
+    def _handle_packet(self, data, addr):
+        self.packets += 1
+        if data[:1] not in (b"/", b"#"):
+            self._midi_parser.feed(data)
+            return
+        try:
+            for address, arguments in parse_packet(data):
+                self._handle(address, arguments, addr)
+        except (OscError, IndexError, TypeError, ValueError):
+            self.errors += 1
+
+    def _handle(self, address, arguments, addr):
+        if address == "/note_on":
+            self._add_message(
+                smf.NOTE_ON | _channel(arguments, 2),
+                int(arguments[0]) & 0x7F,
+                int(arguments[1]) & 0x7F,
+            )
+        elif address == "/note_off":
+            self._add_message(
+                smf.NOTE_OFF | _channel(arguments, 1), int(arguments[0]) & 0x7F, 0
+            )
+        elif address == "/program":
+            self._add_message(
+                smf.PROGRAM_CHANGE | _channel(arguments, 1),
+                int(arguments[0]) & 0x7F,
+                0,
+            )
+        elif address == "/cc":
+            self._add_message(
+                smf.CONTROL_CHANGE | _channel(arguments, 2),
+                int(arguments[0]) & 0x7F,
+                int(arguments[1]) & 0x7F,
+            )
+        elif address == STATS_ADDRESS:
+            reply = encode_message(
+                STATS_ADDRESS, self.packets, self.messages, self.errors
+            )
+            self.transport.sendto(reply, addr)
+        else:
+            self.errors += 1
+
+    def _add_message(self, status, data1, data2):
+        self.messages += 1
+        self._batch.append((status, data1, data2))
+
+    def flush(self):
+        self._flush_scheduled = False
+        batch = self._batch
+        if not batch:
+            return
+        self._batch = []
+        self.synth.send_messages(batch)
+        played_notes = self.played_notes
+        for status, data1, data2 in batch:
+            played_notes.update(status, data1, data2)
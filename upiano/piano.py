@@ -1,7 +1,8 @@
-import subprocess
-
 import urwid
 
+from upiano.note_player import NotePlayer
+from upiano.note_player import spawn_note
+
 """
 This is what we're gonna builddddd....
 ┌──┬───┬┬───┬──┬──┬───┬┬───┬┬───┬──┬──┬───┬┬───┬──┬──┬───┬┬───┬┬───┬──┐
@@ -39,22 +40,33 @@ NOTE_MAP = {
 }
 
 
-# play -qn synth {duration} pluck {note}
-# fade l 0 {duration} {fadeout_len} reverb vol {vol}
+_note_player = None
+# the sox processes still playing, so that they get reaped
+_spawned = []
 
 
 def play_note(note="C", duration=1.5, delay=0, vol=1, verbose=False):
-    # requires sox to be installed: http://sox.sf.net
-    fadeout_len = duration / 2.0
-    command = (
-        "play -qn synth {duration} pluck {note}"
-        " fade l 0 {duration} {fadeout_len} reverb vol {vol}"
-    ).format(note=note, duration=duration, fadeout_len=fadeout_len, vol=vol)
+    """
+    Play a note through a single, long-lived audio output. Without the
+    built-in synth (it needs NumPy and pacat, aplay or sox's play), every
+    note spawns a sox process instead.
+    """
+    global _note_player, _spawned
+    if _note_player is None:
+        try:
+            _note_player = NotePlayer()
+        except (ImportError, OSError):
+            _note_player = False
+    if _note_player:
+        _note_player.play(note, duration, vol)
+    else:
+        _spawned = [process for process in _spawned if process.poll() is None]
+        _spawned.append(spawn_note(note, duration, vol, verbose))
 
-    if verbose:
-        print(command)
 
-    subprocess.Popen(command.split(), stderr=subprocess.DEVNULL)
+def stop_notes():
+    if _note_player:
+        _note_player.close()
 
 
 def handle_key(key):
@@ -69,4 +81,7 @@ if __name__ == "__main__":
     txt = urwid.Text("Play some piano, mannnnnnn!!!")
     fill = urwid.Filler(txt, "top")
     loop = urwid.MainLoop(fill, unhandled_input=handle_key)
-    loop.run()
+    try:
+        loop.run()
+    finally:
+        stop_notes()
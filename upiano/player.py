@@ -0,0 +1,112 @@
+"""
+Real time playback of MIDI files.
+"""
+import threading
+from time import monotonic
+
+from upiano import smf
+from upiano.note_pipeline import MIDI_NOTES
+
+
+class PlayedNotes:
+    """
+    How many times each pitch is being played by a source of notes, updated
+    by the thread playing them, for the UI to show whenever it gets to it.
+
+    The UI reads the current state rather than a queue of changes, so it
+    never delays the audio, and however late it is it can't miss a release.
+    """
+
+    def __init__(self):
+        self.counts = bytearray(MIDI_NOTES)
+
+    def update(self, status: int, data1: int, data2: int):
+        """
+        Count a MIDI message, if it's a note on or off.
+        """
+        kind = status & 0xF0
+        if kind == smf.NOTE_ON and data2 > 0:
+            count = self.counts[data1]
+            if count < 255:
+                self.counts[data1] = count + 1
+        elif kind == smf.NOTE_ON or kind == smf.NOTE_OFF:
+            count = self.counts[data1]
+            if count:
+                self.counts[data1] = count - 1
+
+    def clear(self):
+        self.counts[:] = bytes(MIDI_NOTES)
+
+
+class MidiFilePlayer:
+    """
+    Plays a MIDI file on a synth from a dedicated thread.
+
+    Events are streamed from the file as they are played, and each one is
+    scheduled against the start time on the monotonic clock rather than
+    the previous event, so timing errors don't accumulate and the player
+    catches up after a hiccup.
+
+    The notes played are counted in `played_notes`, for the UI to show.
+
+    An error reading the file stops the playback, and is kept in `error`
+    and passed to `on_error`, called from the player's thread.
+    """
+
+    def __init__(self, synth, path, clock=monotonic, on_error=None):
+        self.synth = synth
+        self.path = path
+        self.clock = clock
+        self.on_error = on_error
+        self.error = None
+        self.played_notes = PlayedNotes()
+        self.events_played = 0
+        self.max_lateness = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def playing(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self.run, name="midi-file-player", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def run(self):
+        synth = self.synth
+        played_notes = self.played_notes
+        start = self.clock()
+        try:
+            for event_time, status, data1, data2 in smf.read_events(self.path):
+                delay = start + event_time - self.clock()
+                if delay > 0:
+                    if self._stop.wait(delay):
+                        break
+                elif self._stop.is_set():
+                    break
+                elif -delay > self.max_lateness:
+                    self.max_lateness = -delay
+
+                synth.send_message(status, data1, data2)
+                self.events_played += 1
+                played_notes.update(status, data1, data2)
+        except (OSError, smf.MidiFileError) as error:
+            self.error = error
+            if self.on_error is not None:
+                self.on_error(error)
+        finally:
+            self.all_notes_off()
+
+    def all_notes_off(self):
+        for channel in range(16):
+            # All Notes Off, on every channel
+            self.synth.send_message(smf.CONTROL_CHANGE | channel, 123, 0)
+        self.played_notes.clear()
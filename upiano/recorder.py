@@ -0,0 +1,142 @@
+"""
+Recording of what gets played, for exporting it as a MIDI file.
+"""
+from array import array
+from time import monotonic_ns
+
+from upiano import smf
+from upiano.smf import CONTROL_CHANGE
+from upiano.smf import PITCH_BEND
+from upiano.smf import PROGRAM_CHANGE
+
+# Each record packs the time in microseconds and the 3 bytes of the message
+# in a single 64-bit integer, leaving 40 bits for the time (about 12 days).
+_TIME_SHIFT = 24
+# controllers from this one on are channel mode messages, not settings
+_FIRST_MODE_CONTROL = 120
+
+
+def _setting(status, data1):
+    """
+    Return what a message sets, if it's a program, controller or pitch bend
+    change, or None.
+    """
+    kind = status & 0xF0
+    if kind == CONTROL_CHANGE:
+        return status << 8 | data1 if data1 < _FIRST_MODE_CONTROL else None
+    if kind == PROGRAM_CHANGE or kind == PITCH_BEND:
+        return status << 8
+    return None
+
+
+class PerformanceRecorder:
+    """
+    Records MIDI channel messages in a preallocated ring of 64-bit records.
+
+    Recording a message is a clock read and an integer store, and memory
+    doesn't grow with the length of the session: an hour of busy playing
+    fits in the default capacity, and once the ring is full the oldest
+    messages are overwritten.
+
+    The program, controllers and pitch bend of each channel are tracked
+    even when not recording, so that a recording plays back with the sound
+    it was made with: they are exported first, as they were at the start
+    of the recording, or at its oldest message kept once the ring is full.
+
+    `clock` must return integer nanoseconds.
+    """
+
+    def __init__(self, capacity=1 << 18, clock=monotonic_ns):
+        self.capacity = capacity
+        self.clock = clock
+        self.recording = False
+        self._records = array("Q", bytes(8 * capacity))
+        self._next = 0
+        self._count = 0
+        self._start = 0
+        # the last message setting each program, controller and pitch bend,
+        # now and before the oldest message recorded
+        self._settings = {}
+        self._initial_settings = {}
+
+    def __len__(self):
+        return min(self._count, self.capacity)
+
+    def start(self):
+        """
+        Start a new recording, discarding the previous one.
+        """
+        self._next = 0
+        self._count = 0
+        self._start = self.clock()
+        self._initial_settings = dict(self._settings)
+        self.recording = True
+
+    def stop(self):
+        self.recording = False
+
+    def record(self, status: int, data1: int, data2: int = 0):
+        if (status & 0xF0) >= CONTROL_CHANGE:
+            setting = _setting(status, data1)
+            if setting is not None:
+                self._settings[setting] = (status, data1, data2)
+        if not self.recording:
+            return
+        index = self._next
+        if self._count >= self.capacity:
+            self._drop(self._records[index])
+        self._records[index] = (
+            (self.clock() - self._start) // 1000 << _TIME_SHIFT
+            | status << 16
+            | data1 << 8
+            | data2
+        )
+        self._next = index + 1 if index + 1 < self.capacity else 0
+        self._count += 1
+
+    def _drop(self, record):
+        # the oldest message, about to be overwritten: what it sets now
+        # applies from the start of what's kept
+        status = (record >> 16) & 0xFF
+        data1 = (record >> 8) & 0xFF
+        setting = _setting(status, data1)
+        if setting is not None:
+            self._initial_settings[setting] = (status, data1, record & 0xFF)
+
+    def events(self):
+        """
+        Yield the recorded messages as (time, status, data1, data2), with
+        the time in seconds since the start of the recording, after the
+        settings they start with.
+        """
+        wrapped = self._count > self.capacity
+        if wrapped:
+            indexes = range(self._next, self._next + self.capacity)
+        else:
+            indexes = range(self._count)
+        records = self._records
+        first_time = 0.0
+        if indexes:
+            first_time = (records[indexes[0] % self.capacity] >> _TIME_SHIFT) / 1e6
+        for status, data1, data2 in self._initial_settings.values():
+            yield first_time, status, data1, data2
+        # the notes started before the oldest message kept are lost, and so
+        # are their releases
+        started = set()
+        for index in indexes:
+            record = records[index % self.capacity]
+            status = (record >> 16) & 0xFF
+            data1 = (record >> 8) & 0xFF
+            data2 = record & 0xFF
+            if wrapped:
+                kind = status & 0xF0
+                note = (status & 0x0F, data1)
+                if kind == smf.NOTE_ON and data2 > 0:
+                    started.add(note)
+                elif kind == smf.NOTE_ON or kind == smf.NOTE_OFF:
+                    if note not in started:
+                        continue
+            yield (record >> _TIME_SHIFT) / 1_000_000, status, data1, data2
+
+    def save(self, path):
+        smf.write_events(path, self.events())
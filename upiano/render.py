@@ -0,0 +1,70 @@
+"""
+Offline rendering of MIDI files to WAV, faster than real time.
+"""
+import time
+import wave
+from dataclasses import dataclass
+
+from upiano import midi
+from upiano import smf
+
+# Largest number of frames pulled from the synth at once
+BLOCK_FRAMES = 8192
+
+
+@dataclass
+class RenderResult:
+    frames: int
+    sample_rate: int
+    elapsed: float
+
+    @property
+    def duration(self):
+        return self.frames / self.sample_rate
+
+    @property
+    def realtime_factor(self):
+        return self.duration / self.elapsed if self.elapsed else float("inf")
+
+
+def render_midi_file(
+    midi_path,
+    wav_path,
+    soundfont_name=None,
+    sample_rate=44100,
+    tail=2.0,
+    engine=None,
+) -> RenderResult:
+    """
+    Render a MIDI file to a 16-bit stereo WAV file, adding `tail` seconds
+    at the end for the last notes to ring out.
+
+    The synth runs without an audio driver and the audio is streamed to the
+    file as it's rendered, so memory doesn't grow with the length of the
+    file.
+    """
+    started = time.perf_counter()
+    synth = midi.create_synth(
+        soundfont_name, sample_rate=sample_rate, start_audio=False, engine=engine
+    )
+
+    with wave.open(wav_path, "wb") as out:
+        out.setnchannels(2)
+        out.setsampwidth(2)
+        out.setframerate(sample_rate)
+
+        frames = 0
+
+        def render_until(target_frames):
+            nonlocal frames
+            while frames < target_frames:
+                block = min(BLOCK_FRAMES, target_frames - frames)
+                out.writeframesraw(synth.get_samples(block).tobytes())
+                frames += block
+
+        for event_time, status, data1, data2 in smf.read_events(midi_path):
+            render_until(int(event_time * sample_rate))
+            synth.send_message(status, data1, data2)
+        render_until(frames + int(tail * sample_rate))
+
+    return RenderResult(frames, sample_rate, time.perf_counter() - started)
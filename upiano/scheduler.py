@@ -0,0 +1,113 @@
+"""
+Scheduling of note events, such as releasing a note after some time.
+"""
+from time import monotonic
+
+
+class TimerWheel:
+    """
+    Hashed timer wheel for events keyed by note (or any hashable).
+
+    Each key has at most one pending event: scheduling it again replaces
+    the previous one, so a note pressed again doesn't get cut short by the
+    release scheduled for the earlier press. Scheduling and cancelling are
+    O(1), and `advance` fires all the events that are due in one go, so it
+    can be driven by a single periodic tick.
+
+    A wheel can be shared by several users, each keying its events with a
+    tuple starting with its own tag, such as ("repeat", key), so that they
+    can't replace or cancel each other's.
+
+    Times are taken from `clock`, unless given explicitly.
+    """
+
+    def __init__(self, resolution=0.01, slots=512, clock=monotonic):
+        self.resolution = resolution
+        self.clock = clock
+        # called when an event gets scheduled on an empty wheel, so that
+        # whatever drives the ticks can be paused while there is nothing to do
+        self.wakeup = None
+        self._slots = [{} for _ in range(slots)]
+        self._entries = {}
+        self._tick = int(clock() / resolution)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def schedule(self, key, delay, callback, now=None):
+        """
+        Call `callback(key)` after `delay` seconds, replacing any event
+        already scheduled for `key`. An event already due when scheduled
+        fires on the next `advance`:
+
+        >>> wheel = TimerWheel(clock=lambda: 0.0)
+        >>> wheel.schedule("a", 1.0, print, now=0.0)
+        >>> wheel.advance(now=0.5)
+        >>> wheel.schedule("b", 0.1, print, now=0.2)
+        >>> wheel.advance(now=0.51)
+        b
+        """
+        if now is None:
+            now = self.clock()
+        previous = self._entries.get(key)
+        if previous is not None:
+            del previous[key]
+        elif not self._entries:
+            self._tick = int(now / self.resolution)
+            if self.wakeup is not None:
+                self.wakeup()
+        deadline = now + delay
+        # a deadline in a tick already advanced past (from an earlier `now`)
+        # goes in the current tick's slot, to fire on the next advance
+        # rather than once the wheel has gone all the way round
+        tick = max(int(deadline / self.resolution), self._tick)
+        slot = self._slots[tick % len(self._slots)]
+        slot[key] = (deadline, callback)
+        self._entries[key] = slot
+
+    def cancel(self, key) -> bool:
+        slot = self._entries.pop(key, None)
+        if slot is None:
+            return False
+        del slot[key]
+        return True
+
+    def advance(self, now=None):
+        """
+        Fire all the events due by `now`.
+        """
+        if now is None:
+            now = self.clock()
+        target = int(now / self.resolution)
+        if not self._entries:
+            self._tick = target
+            return
+
+        slot_count = len(self._slots)
+        first = max(self._tick, target - slot_count + 1)
+        due = []
+        for tick in range(first, target + 1):
+            for key, (deadline, _) in self._slots[tick % slot_count].items():
+                if deadline <= now:
+                    due.append(key)
+        # events later in the current tick are still in its slot, so it's
+        # scanned again on the next call
+        self._tick = target
+
+        for key in due:
+            # an earlier callback may have cancelled or rescheduled it
+            slot = self._entries.get(key)
+            if slot is None:
+                continue
+            deadline, callback = slot[key]
+            if deadline <= now:
+                self.cancel(key)
+                callback(key)
+
+    def clear(self):
+        for slot in self._slots:
+            slot.clear()
+        self._entries.clear()
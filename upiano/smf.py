@@ -0,0 +1,209 @@
+"""
+Streaming reader for Standard MIDI Files.
+
+Tracks are parsed lazily, a buffer at a time, and merged in time order as
+they are read, so even huge files start yielding events right away and
+only use a few kilobytes of memory.
+"""
+import heapq
+import struct
+
+NOTE_OFF = 0x80
+NOTE_ON = 0x90
+POLY_AFTERTOUCH = 0xA0
+CONTROL_CHANGE = 0xB0
+PROGRAM_CHANGE = 0xC0
+CHANNEL_AFTERTOUCH = 0xD0
+PITCH_BEND = 0xE0
+
+META = 0xFF
+META_TEMPO = 0x51
+META_END_OF_TRACK = 0x2F
+
+DEFAULT_TEMPO = 500_000  # microseconds per beat, i.e. 120 BPM
+
+DATA_LENGTHS = {
+    NOTE_OFF: 2,
+    NOTE_ON: 2,
+    POLY_AFTERTOUCH: 2,
+    CONTROL_CHANGE: 2,
+    PROGRAM_CHANGE: 1,
+    CHANNEL_AFTERTOUCH: 1,
+    PITCH_BEND: 2,
+}
+
+_BUFFER_SIZE = 8192
+
+
+class MidiFileError(ValueError):
+    pass
+
+
+class _TrackReader:
+    """
+    Reads a track chunk through a shared file object, a buffer at a time.
+    """
+
+    def __init__(self, f, offset, length):
+        self.f = f
+        self.position = offset
+        self.end = offset + length
+        self.buffer = b""
+        self.index = 0
+
+    def _fill(self):
+        size = min(_BUFFER_SIZE, self.end - self.position)
+        if size <= 0:
+            raise MidiFileError("Unexpected end of track")
+        self.f.seek(self.position)
+        self.buffer = self.buffer[self.index :] + self.f.read(size)
+        self.position += size
+        self.index = 0
+
+    def read_byte(self):
+        if self.index >= len(self.buffer):
+            self._fill()
+        byte = self.buffer[self.index]
+        self.index += 1
+        return byte
+
+    def read(self, length):
+        while len(self.buffer) - self.index < length:
+            self._fill()
+        data = self.buffer[self.index : self.index + length]
+        self.index += length
+        return data
+
+    def read_varlen(self):
+        value = 0
+        while True:
+            byte = self.read_byte()
+            value = (value << 7) | (byte & 0x7F)
+            if not byte & 0x80:
+                return value
+
+    def at_end(self):
+        return self.index >= len(self.buffer) and self.position >= self.end
+
+
+def _read_track(f, offset, length, track_index):
+    """
+    Yield (tick, track_index, status, data1, data2) for the channel messages
+    and tempo changes of a track, with tempo as (META, META_TEMPO, tempo).
+    """
+    reader = _TrackReader(f, offset, length)
+    tick = 0
+    status = 0
+    while not reader.at_end():
+        tick += reader.read_varlen()
+        byte = reader.read_byte()
+        if byte < 0x80:
+            # running status: the byte is already the first data byte
+            if not status:
+                raise MidiFileError("Data byte without status")
+            data1 = byte
+        elif byte < 0xF0:
+            status = byte
+            data1 = reader.read_byte()
+        elif byte == META:
+            meta_type = reader.read_byte()
+            data = reader.read(reader.read_varlen())
+            if meta_type == META_TEMPO:
+                yield tick, track_index, META, META_TEMPO, int.from_bytes(data, "big")
+            elif meta_type == META_END_OF_TRACK:
+                return
+            continue
+        elif byte in (0xF0, 0xF7):
+            # sysex, skipped
+            reader.read(reader.read_varlen())
+            continue
+        else:
+            raise MidiFileError("Unexpected status byte: 0x%02X" % byte)
+
+        if DATA_LENGTHS[status & 0xF0] == 2:
+            yield tick, track_index, status, data1, reader.read_byte()
+        else:
+            yield tick, track_index, status, data1, 0
+
+
+def read_events(path):
+    """
+    Yield the channel messages of a MIDI file as (time, status, data1, data2)
+    tuples, in time order across all the tracks, with the time in seconds.
+    """
+    with open(path, "rb") as f:
+        chunk_type, length = struct.unpack(">4sL", f.read(8))
+        if chunk_type != b"MThd":
+            raise MidiFileError("Not a MIDI file: %r" % path)
+        _format, track_count, division = struct.unpack(">HHH", f.read(6))
+        f.seek(8 + length)
+
+        tracks = []
+        offset = 8 + length
+        while len(tracks) < track_count:
+            header = f.read(8)
+            if len(header) < 8:
+                break
+            chunk_type, length = struct.unpack(">4sL", header)
+            offset += 8
+            if chunk_type == b"MTrk":
+                tracks.append(_read_track(f, offset, length, len(tracks)))
+            offset += length
+            f.seek(offset)
+
+        if division & 0x8000:
+            # SMPTE timing: frames per second and ticks per frame
+            frames_per_second = 256 - (division >> 8)
+            seconds_per_tick = 1 / (frames_per_second * (division & 0xFF))
+            tempo_scale = None
+        else:
+            tempo_scale = 1 / (division * 1_000_000)
+            seconds_per_tick = DEFAULT_TEMPO * tempo_scale
+
+        # time and tick of the latest tempo change
+        tempo_time = 0.0
+        tempo_tick = 0
+        for tick, _, status, data1, data2 in heapq.merge(*tracks):
+            if status == META:
+                if tempo_scale is not None:
+                    tempo_time += (tick - tempo_tick) * seconds_per_tick
+                    tempo_tick = tick
+                    seconds_per_tick = data2 * tempo_scale
+                continue
+            yield tempo_time + (
+                tick - tempo_tick
+            ) * seconds_per_tick, status, data1, data2
+
+
+def _varlen(value):
+    data = bytearray([value & 0x7F])
+    value >>= 7
+    while value:
+        data.insert(0, (value & 0x7F) | 0x80)
+        value >>= 7
+    return data
+
+
+def write_events(path, events, ticks_per_beat=480, tempo=DEFAULT_TEMPO):
+    """
+    Write (time, status, data1, data2) channel messages, with the time in
+    seconds, to a single track MIDI file.
+    """
+    ticks_per_second = ticks_per_beat * 1_000_000 / tempo
+    track = bytearray()
+    track += b"\x00\xff\x51\x03" + tempo.to_bytes(3, "big")
+    last_tick = 0
+    for time, status, data1, data2 in events:
+        tick = max(last_tick, round(time * ticks_per_second))
+        track += _varlen(tick - last_tick)
+        track.append(status)
+        track.append(data1)
+        if DATA_LENGTHS[status & 0xF0] == 2:
+            track.append(data2)
+        last_tick = tick
+    track += b"\x00\xff\x2f\x00"
+
+    with open(path, "wb") as f:
+        f.write(struct.pack(">4sLHHH", b"MThd", 6, 0, 1, ticks_per_beat))
+        f.write(struct.pack(">4sL", b"MTrk", len(track)))
+        f.write(track)
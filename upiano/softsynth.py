@@ -0,0 +1,578 @@
+"""
+Built-in NumPy synthesizer, for when FluidSynth isn't available.
+
+It has the same interface as MidiSynth. The plucked and struck instruments
+(pianos, mallets, guitars, basses, harps...) are Karplus-Strong strings,
+the others simple additive voices: a few harmonics with an envelope. All
+the voices are computed together, per block, as arrays: there is no Python
+loop per sample nor per voice.
+
+The audio is played by piping raw samples to a player program (pacat,
+aplay or sox's play), so that nothing native is needed besides NumPy.
+"""
+import fcntl
+import math
+import shutil
+import subprocess
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from upiano.audio import AudioSettings
+
+MAX_VOICES = 64
+# largest block rendered at once, to bound the size of the arrays
+MAX_BLOCK_FRAMES = 2048
+DEFAULT_PERIOD_SIZE = 512
+
+DRUMS_CHANNEL = 9
+# shortest delay line of the strings, in samples
+MIN_STRING_DELAY = 32
+MASTER_GAIN = 0.3
+HARMONICS = 6
+
+# voice state below this level is silence, and the voice is freed once released
+_SILENCE = 1e-4
+
+# GM programs played as plucked or struck strings: pianos, chromatic
+# percussion, guitars and basses by family, and a few others
+_PLUCKED_FAMILIES = {0, 1, 3, 4}
+_PLUCKED_PROGRAMS = {45, 46, 104, 105, 106, 107, 108}
+
+# relative amplitudes of the harmonics of the additive voices, by GM family
+_FAMILY_HARMONICS = {
+    2: [1, 0.8, 0.6, 0.5, 0.4, 0.3],  # organ
+    5: [1, 0.5, 0.33, 0.25, 0.2, 0.16],  # strings
+    6: [1, 0.5, 0.33, 0.25, 0.2, 0.16],  # ensemble
+    7: [1, 0.7, 0.5, 0.4, 0.3, 0.2],  # brass
+    8: [1, 0, 0.33, 0, 0.2, 0],  # reed
+    9: [1, 0.2, 0.05, 0, 0, 0],  # pipe
+    10: [1, 0.5, 0.33, 0.25, 0.2, 0.16],  # synth lead
+    11: [1, 0.3, 0.1, 0.05, 0, 0],  # synth pad
+}
+_DEFAULT_HARMONICS = [1, 0.5, 0.25, 0.12, 0.06, 0.03]
+# attack time of the additive voices, in seconds, by GM family
+_FAMILY_ATTACK = {5: 0.08, 6: 0.1, 11: 0.2}
+_DEFAULT_ATTACK = 0.01
+
+_PLUCK_DECAY = 0.999
+_DRUM_DECAY = 0.9
+# release times, in seconds
+_PLUCK_RELEASE = 0.05
+_ADDITIVE_RELEASE = 0.15
+
+# players reading 16-bit stereo samples on stdin, by audio driver name
+_PLAYERS = {
+    "pulseaudio": [
+        "pacat",
+        "--playback",
+        "--raw",
+        "--format=s16le",
+        "--rate={rate}",
+        "--channels=2",
+        "--latency-msec={latency_ms}",
+    ],
+    "alsa": [
+        "aplay",
+        "-q",
+        "-t",
+        "raw",
+        "-f",
+        "S16_LE",
+        "-r",
+        "{rate}",
+        "-c",
+        "2",
+        "--period-size={period}",
+        "--buffer-size={buffer}",
+        "-",
+    ],
+    "sox": [
+        "play",
+        "-q",
+        "-t",
+        "raw",
+        "-e",
+        "signed",
+        "-b",
+        "16",
+        "-c",
+        "2",
+        "-r",
+        "{rate}",
+        "--buffer",
+        "{buffer_bytes}",
+        "-",
+    ],
+}
+# PipeWire and JACK setups usually have the PulseAudio server too
+_PLAYERS["pipewire"] = _PLAYERS["jack"] = _PLAYERS["pulseaudio"]
+
+
+def _harmonics_table():
+    table = np.empty((16, HARMONICS))
+    for family in range(16):
+        amplitudes = np.array(_FAMILY_HARMONICS.get(family, _DEFAULT_HARMONICS))
+        table[family] = amplitudes / amplitudes.sum()
+    return table
+
+
+def find_player(driver=None):
+    """
+    Return the name of the audio driver of the first player program
+    installed, trying `driver` first.
+    """
+    names = list(_PLAYERS)
+    if driver in _PLAYERS:
+        names.insert(0, driver)
+    for name in names:
+        if shutil.which(_PLAYERS[name][0]):
+            return name
+    return None
+
+
+class SoftSynth:
+    """
+    Polyphonic synth rendering blocks of audio with NumPy.
+
+    Calls coming from any thread are queued and applied at the start of the
+    next block. Up to `max_voices` notes sound at once: beyond that, the
+    quietest releasing voice (or else the oldest one) is taken over.
+    """
+
+    ENGINE = "numpy"
+
+    def __init__(
+        self,
+        soundfont_name=None,
+        sample_rate=44100,
+        start_audio=True,
+        audio_settings=None,
+        max_voices=MAX_VOICES,
+    ):
+        if audio_settings is None:
+            audio_settings = AudioSettings(sample_rate=sample_rate)
+        self.sample_rate = audio_settings.sample_rate
+        self.max_voices = max_voices
+        # set when created because FluidSynth wasn't available
+        self.fallback_reason = None
+        self._events = deque()
+
+        self._programs = [0] * 16
+        self._volumes = np.full(16, 100 / 127)
+        self._sustain = np.zeros(16, dtype=bool)
+        self._bends = np.ones(16)
+        self._controls = [[0] * 128 for _ in range(16)]
+        self._harmonics = _harmonics_table()
+        self._harmonic_numbers = np.arange(1, HARMONICS + 1)
+
+        voices = max_voices
+        self._active = np.zeros(voices, dtype=bool)
+        self._plucked = np.zeros(voices, dtype=bool)
+        # key held down, and held by the sustain pedal after its release
+        self._held = np.zeros(voices, dtype=bool)
+        self._sustained = np.zeros(voices, dtype=bool)
+        self._channel = np.zeros(voices, dtype=np.int64)
+        self._note = np.zeros(voices, dtype=np.int64)
+        self._started = np.zeros(voices, dtype=np.int64)
+        self._gain = np.zeros(voices)
+        # envelope: moves from `level` towards `target` by a factor of
+        # exp(rate) per sample
+        self._level = np.zeros(voices)
+        self._target = np.zeros(voices)
+        self._rate = np.zeros(voices)
+        self._release_rate = np.zeros(voices)
+        # additive voices
+        self._phase = np.zeros(voices)
+        self._increment = np.zeros(voices)
+        self._amplitudes = np.zeros((voices, HARMONICS))
+        # strings: the delay line is a ring per voice, read `delay` samples
+        # back with three taps, for the averaging filter and the fraction
+        lowest_frequency = 440 * 2 ** (-69 / 12)
+        self._ring_size = int(self.sample_rate / lowest_frequency) + 4
+        self._rings = np.zeros((voices, self._ring_size), dtype=np.float32)
+        self._position = np.zeros(voices, dtype=np.int64)
+        self._delay = np.zeros(voices, dtype=np.int64)
+        self._taps = np.zeros((voices, 3))
+        self._decay = np.zeros(voices)
+
+        self._voices_started = 0
+        self._output = np.zeros((voices, MAX_BLOCK_FRAMES))
+        self._frames_index = np.arange(MAX_BLOCK_FRAMES)
+        self._rng = np.random.default_rng()
+
+        self.frames_rendered = 0
+        self.render_seconds = 0.0
+        self._load = None
+
+        self.period_size = audio_settings.period_size or DEFAULT_PERIOD_SIZE
+        self.driver = None
+        self._player = None
+        self._stop = threading.Event()
+        if start_audio:
+            self._start_player(audio_settings.driver)
+
+    # MidiSynth interface
+
+    def select_midi_program(self, program_id, channel=0, bank_id=0):
+        self._events.append((self._program, channel, program_id))
+
+    def note_on(self, note_value, channel=0, velocity=100):
+        self._events.append((self._note_on, channel, note_value, velocity))
+
+    def note_off(self, note_value, channel=0):
+        self._events.append((self._note_off, channel, note_value))
+
+    def notes_on(self, notes, velocity=100):
+        append = self._events.append
+        note_on = self._note_on
+        for note_value, channel in notes:
+            append((note_on, channel, note_value, velocity))
+
+    def notes_off(self, notes):
+        append = self._events.append
+        note_off = self._note_off
+        for note_value, channel in notes:
+            append((note_off, channel, note_value))
+
+    def control_change(self, control, value, channel=0):
+        self._events.append((self._control_change, channel, control, value))
+
+    def set_sustain(self, value, channel=0):
+        self.control_change(64, value, channel)
+
+    def set_volume(self, value, channel=0):
+        self.control_change(7, value, channel)
+
+    def set_chorus(self, value, channel=0):
+        self.control_change(93, value, channel)
+
+    def set_reverb(self, value, channel=0):
+        self.control_change(91, value, channel)
+
+    def send_message(self, status, data1, data2=0):
+        kind = status & 0xF0
+        channel = status & 0x0F
+        if kind == 0x90 and data2:
+            self.note_on(data1, channel, data2)
+        elif kind in (0x80, 0x90):
+            self.note_off(data1, channel)
+        elif kind == 0xB0:
+            self.control_change(data1, data2, channel)
+        elif kind == 0xC0:
+            self.select_midi_program(data1, channel)
+        elif kind == 0xE0:
+            self._events.append((self._pitch_bend, channel, data1 | data2 << 7))
+
+    def send_messages(self, messages):
+        send_message = self.send_message
+        for status, data1, data2 in messages:
+            send_message(status, data1, data2)
+
+    def get_samples(self, frames):
+        """
+        Render the next `frames` frames of audio, as interleaved 16-bit stereo.
+        """
+        started = time.perf_counter()
+        mono = np.empty(frames)
+        done = 0
+        while done < frames:
+            block = min(MAX_BLOCK_FRAMES, frames - done)
+            self._apply_events()
+            mono[done : done + block] = self._render(block)
+            done += block
+        samples = np.empty(frames * 2, dtype=np.int16)
+        samples[0::2] = samples[1::2] = np.tanh(mono) * 32767
+        elapsed = time.perf_counter() - started
+        self.frames_rendered += frames
+        self.render_seconds += elapsed
+        load = elapsed * self.sample_rate / frames * 100
+        self._load = load if self._load is None else self._load * 0.9 + load * 0.1
+        return samples
+
+    def audio_settings(self):
+        return AudioSettings(
+            driver=self.driver,
+            sample_rate=self.sample_rate,
+            period_size=self.period_size,
+            # one period in the pipe, and about one in the player
+            periods=2,
+        )
+
+    def restart_audio(self, audio_settings):
+        self.period_size = audio_settings.period_size
+        if self._player is not None:
+            self._set_pipe_size()
+
+    def cpu_load(self):
+        """
+        Return the time spent rendering in percent of the time rendered,
+        averaged over the last blocks.
+        """
+        return self._load
+
+    @property
+    def realtime_factor(self):
+        """
+        How many times faster than real time the audio has been rendered.
+        """
+        if not self.render_seconds:
+            return None
+        return self.frames_rendered / self.sample_rate / self.render_seconds
+
+    @property
+    def voices(self):
+        return int(self._active.sum())
+
+    def close(self):
+        self._stop.set()
+        if self._player is not None:
+            self._player.terminate()
+
+    # audio output
+
+    def _start_player(self, driver):
+        self.driver = find_player(driver)
+        if self.driver is None:
+            raise OSError("No audio player found, install pacat, aplay or sox's play")
+        rate = self.sample_rate
+        period = self.period_size
+        arguments = [
+            argument.format(
+                rate=rate,
+                period=period,
+                buffer=period * 2,
+                buffer_bytes=period * 4,
+                latency_ms=max(1, period * 1000 // rate),
+            )
+            for argument in _PLAYERS[self.driver]
+        ]
+        self._player = subprocess.Popen(
+            arguments, stdin=subprocess.PIPE, stderr=subprocess.DEVNULL, bufsize=0
+        )
+        self._set_pipe_size()
+        threading.Thread(target=self._play, name="softsynth", daemon=True).start()
+
+    def _set_pipe_size(self):
+        # the pipe is a buffer too: by default it holds a third of a second
+        set_pipe_size = getattr(fcntl, "F_SETPIPE_SZ", None)
+        if set_pipe_size is not None:
+            try:
+                fcntl.fcntl(self._player.stdin, set_pipe_size, self.period_size * 4)
+            except OSError:
+                pass
+
+    def _play(self):
+        write = self._player.stdin.write
+        while not self._stop.is_set():
+            try:
+                write(self.get_samples(self.period_size).tobytes())
+            except (BrokenPipeError, ValueError):
+                break
+
+    # events, applied from the rendering thread
+
+    def _apply_events(self):
+        events = self._events
+        while events:
+            method, *arguments = events.popleft()
+            method(*arguments)
+
+    def _program(self, channel, program):
+        self._programs[channel] = program
+
+    def _control_change(self, channel, control, value):
+        self._controls[channel][control] = value
+        if control == 7:
+            self._volumes[channel] = value / 127
+        elif control == 64:
+            self._sustain[channel] = value >= 64
+            if value < 64:
+                self._release(self._sustained & (self._channel == channel))
+        elif control == 120:
+            # all sound off
+            voices = self._channel == channel
+            self._active[voices] = False
+            self._held[voices] = False
+            self._sustained[voices] = False
+        elif control == 123:
+            # all notes off
+            self._release(self._active & (self._channel == channel))
+
+    def _pitch_bend(self, channel, value):
+        # the default range of two semitones
+        self._bends[channel] = 2 ** ((value - 8192) / 8192 * 2 / 12)
+
+    def _release(self, voices):
+        self._held[voices] = False
+        self._sustained[voices] = False
+        self._target[voices] = 0.0
+        self._rate[voices] = self._release_rate[voices]
+
+    def _note_off(self, channel, note):
+        voices = self._held & (self._channel == channel) & (self._note == note)
+        if self._sustain[channel]:
+            self._held[voices] = False
+            self._sustained[voices] = True
+        else:
+            self._release(voices)
+
+    def _allocate_voice(self):
+        free = np.flatnonzero(~self._active)
+        if len(free):
+            return free[0]
+        releasing = np.flatnonzero(~self._held & ~self._sustained)
+        if len(releasing):
+            return releasing[np.argmin(self._level[releasing])]
+        return int(np.argmin(self._started))
+
+    def _note_on(self, channel, note, velocity):
+        if not velocity:
+            self._note_off(channel, note)
+            return
+        voice = self._allocate_voice()
+        program = self._programs[channel]
+        family = program // 8
+        frequency = 440 * 2 ** ((note - 69) / 12)
+        rate = self.sample_rate
+
+        self._active[voice] = True
+        self._held[voice] = True
+        self._sustained[voice] = False
+        self._channel[voice] = channel
+        self._note[voice] = note
+        self._voices_started += 1
+        self._started[voice] = self._voices_started
+        self._gain[voice] = velocity / 127
+        self._target[voice] = 1.0
+
+        plucked = (
+            channel == DRUMS_CHANNEL
+            or family in _PLUCKED_FAMILIES
+            or program in _PLUCKED_PROGRAMS
+        )
+        self._plucked[voice] = plucked
+        if plucked:
+            # the string makes its own attack and decay
+            self._level[voice] = 1.0
+            self._rate[voice] = 0.0
+            self._release_rate[voice] = -1 / (_PLUCK_RELEASE * rate)
+            # high notes loop over several periods, so that strings are
+            # computed in chunks of at least MIN_STRING_DELAY samples
+            period = rate / frequency
+            repeats = math.ceil(MIN_STRING_DELAY / period)
+            # the loop delays by delay + fraction + 1/2 (from the averaging)
+            loop = min(period * repeats, self._ring_size - 3) - 0.5
+            delay = int(loop)
+            fraction = loop - delay
+            self._delay[voice] = delay
+            self._taps[voice] = (0.5 * (1 - fraction), 0.5, 0.5 * fraction)
+            decay = _DRUM_DECAY if channel == DRUMS_CHANNEL else _PLUCK_DECAY
+            self._decay[voice] = decay**repeats
+            # the excitation: a period of noise, interpolated so that it
+            # repeats exactly every period to fill the loop, just behind the
+            # read position
+            points = max(int(period), 2)
+            noise = self._rng.uniform(-1, 1, points + 1)
+            noise -= noise[:points].mean()
+            noise[points] = noise[0]
+            steps = np.arange(delay + 2)
+            excitation = np.interp(
+                steps % period, np.linspace(0, period, points + 1), noise
+            )
+            position = self._position[voice]
+            indexes = (position - delay - 2 + steps) % self._ring_size
+            self._rings[voice, indexes] = excitation
+        else:
+            self._level[voice] = 0.0
+            attack = _FAMILY_ATTACK.get(family, _DEFAULT_ATTACK)
+            self._rate[voice] = -1 / (attack * rate)
+            self._release_rate[voice] = -1 / (_ADDITIVE_RELEASE * rate)
+            self._phase[voice] = 0.0
+            self._increment[voice] = frequency / rate
+            # without the harmonics above the Nyquist frequency, which alias
+            audible = self._harmonic_numbers * frequency < rate / 2
+            self._amplitudes[voice] = self._harmonics[family] * audible
+
+    # rendering
+
+    def _render(self, frames):
+        output = self._output[:, :frames]
+        active = self._active
+        if not active.any():
+            return np.zeros(frames)
+        strings = np.flatnonzero(active & self._plucked)
+        additive = np.flatnonzero(active & ~self._plucked)
+        if len(strings):
+            self._render_strings(strings, frames)
+        if len(additive):
+            self._render_additive(additive, frames)
+
+        voices = np.flatnonzero(active)
+        # envelopes for the whole block: one exp per voice and frame
+        steps = self._frames_index[:frames]
+        level = self._level[voices, None]
+        target = self._target[voices, None]
+        rate = self._rate[voices, None]
+        envelopes = target + (level - target) * np.exp(rate * steps)
+        self._level[voices] = envelopes[:, -1]
+        gains = self._gain[voices] * self._volumes[self._channel[voices]] * MASTER_GAIN
+        voice_output = output[voices] * envelopes * gains[:, None]
+        mix = voice_output.sum(axis=0)
+
+        # free the released voices that went silent: a held one may only be
+        # quiet for now, such as with the volume down
+        released = ~self._held[voices] & ~self._sustained[voices]
+        silent = self._level[voices] < _SILENCE
+        decayed = np.abs(voice_output).max(axis=1) < _SILENCE
+        self._active[voices[released & (silent | decayed)]] = False
+        return mix
+
+    def _render_strings(self, voices, frames):
+        """
+        Karplus-Strong, computed for all the strings at once, in chunks no
+        longer than the shortest delay: every sample of a chunk only depends
+        on samples already computed.
+        """
+        rings = self._rings
+        ring_size = self._ring_size
+        positions = self._position[voices]
+        delays = self._delay[voices, None]
+        taps = self._taps[voices]
+        left, middle, right = (
+            taps[:, tap, None] * self._decay[voices, None] for tap in range(3)
+        )
+        rows = voices[:, None]
+        output = self._output
+        chunk = int(delays.min())
+        done = 0
+        while done < frames:
+            size = min(chunk, frames - done)
+            writes = (positions[:, None] + self._frames_index[:size]) % ring_size
+            reads = writes - delays
+            samples = (
+                left * rings[rows, reads % ring_size]
+                + middle * rings[rows, (reads - 1) % ring_size]
+                + right * rings[rows, (reads - 2) % ring_size]
+            )
+            rings[rows, writes] = samples
+            output[voices, done : done + size] = samples
+            positions += size
+            done += size
+        self._position[voices] = positions % ring_size
+
+    def _render_additive(self, voices, frames):
+        increments = self._increment[voices] * self._bends[self._channel[voices]]
+        phases = (
+            self._phase[voices, None]
+            + increments[:, None] * self._frames_index[:frames]
+        )
+        angles = 2 * np.pi * phases
+        amplitudes = self._amplitudes[voices]
+        samples = amplitudes[:, 0, None] * np.sin(angles)
+        for harmonic in range(1, HARMONICS):
+            samples += amplitudes[:, harmonic, None] * np.sin(angles * (harmonic + 1))
+        self._output[voices, :frames] = samples
+        self._phase[voices] = (phases[:, -1] + increments) % 1.0
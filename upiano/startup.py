@@ -0,0 +1,105 @@
+"""
+Startup profiling: how long the imports and the init phases take.
+"""
+import sys
+from collections import defaultdict
+from time import perf_counter
+
+
+class _TimedLoader:
+    """
+    Wraps a module loader, timing how long executing the module takes.
+    """
+
+    def __init__(self, loader, profiler):
+        self._loader = loader
+        self._profiler = profiler
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        self._profiler._enter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            self._profiler._exit(module.__name__)
+
+
+class ImportProfiler:
+    """
+    Meta path finder that times the imports done while it's installed.
+
+    Each module is charged for its own time only, not the time of the
+    modules it imports, and the times are summed by top level package.
+    """
+
+    def __init__(self):
+        self.times = defaultdict(float)
+        self.modules = defaultdict(int)
+        # time spent importing children, for each module being imported
+        self._stack = []
+
+    def install(self):
+        sys.meta_path.insert(0, self)
+
+    def uninstall(self):
+        sys.meta_path.remove(self)
+
+    def find_spec(self, name, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is not None:
+                if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                    spec.loader = _TimedLoader(spec.loader, self)
+                return spec
+        return None
+
+    def _enter(self):
+        self._stack.append([perf_counter(), 0.0])
+
+    def _exit(self, name):
+        started, children = self._stack.pop()
+        elapsed = perf_counter() - started
+        package = name.partition(".")[0]
+        self.times[package] += elapsed - children
+        self.modules[package] += 1
+        if self._stack:
+            self._stack[-1][1] += elapsed
+
+    def report(self, limit=15):
+        lines = ["Imports (own time per package):"]
+        ranked = sorted(self.times.items(), key=lambda item: -item[1])
+        for package, seconds in ranked[:limit]:
+            lines.append(
+                "  {:<24} {:8.1f} ms  {:4} modules".format(
+                    package, seconds * 1000, self.modules[package]
+                )
+            )
+        rest = ranked[limit:]
+        if rest:
+            lines.append(
+                "  {:<24} {:8.1f} ms".format(
+                    "({} more)".format(len(rest)),
+                    sum(seconds for _, seconds in rest) * 1000,
+                )
+            )
+        lines.append(
+            "  {:<24} {:8.1f} ms".format("total", sum(self.times.values()) * 1000)
+        )
+        return "\n".join(lines)
+
+
+def phases_report(phases: dict):
+    """
+    Format the init phases, given as milliseconds since the start.
+    """
+    lines = ["Startup phases (ms since start):"]
+    for name, at in sorted(phases.items(), key=lambda item: item[1]):
+        lines.append("  {:<24} {:8.1f} ms".format(name, at))
+    return "\n".join(lines)
@@ -4,6 +4,7 @@ from textual.message import Message
 from textual.widget import Widget
 from textual.widgets import Button
 from textual.widgets import Label
+from textual.widgets import Select
 from textual.widgets import Static
 from textual.widgets import Switch
 from textual.css.query import NoMatches
@@ -180,11 +181,94 @@ class LabeledSlider(Widget):
         self.min_value, self.max_value = value_range
         self.watch_value = watch_value
         self.value = value
+        self._given_value = value
 
     def compose(self):
         yield Label(self.label)
-        initial_position = self.value * 20 // (self.max_value - self.min_value)
-        yield Slider(position=initial_position, id=f"{self.id}-slider")
+        yield Slider(position=self._position(self.value), id=f"{self.id}-slider")
+
+    def _position(self, value):
+        return round(value * 20 / (self.max_value - self.min_value))
 
     def on_slider_position_update(self, event):
-        self.value = event.position * (self.max_value - self.min_value) // 20
+        # the slider has fewer positions than values: the position of the
+        # value given stands for that value
+        if event.position == self._position(self._given_value):
+            self.value = self._given_value
+        else:
+            self.value = event.position * (self.max_value - self.min_value) // 20
+
+    def set_value(self, value):
+        self._given_value = value
+        self.value = value
+        self.query_one(Slider).position = self._position(value)
+
+
+class LabeledSelect(Widget):
+    DEFAULT_CSS = """
+    LabeledSelect {
+        height: 5;
+    }
+    """
+
+    value = reactive(None, init=False)
+
+    def __init__(self, label, options, watch_value=None, value=None, id=""):
+        id = id or label.lower().replace(" ", "-").replace(":", "")
+        super().__init__(id=id)
+        self.label = label
+        self.options = options
+        self.watch_value = watch_value
+        self.initial_value = options[0][1] if value is None else value
+
+    def compose(self):
+        yield Label(self.label)
+        yield Select(
+            options=self.options,
+            allow_blank=False,
+            value=self.initial_value,
+            id="{}-select".format(self.id),
+        )
+
+    def on_select_changed(self, event):
+        event.stop()
+        if event.value is not None:
+            self.value = event.value
+
+
+class LatencyPanel(Static):
+    """
+    Shows the median and 99th percentile of each stage of a LatencyMonitor,
+    and the audio output settings and load, once there's an AudioMonitor.
+    """
+
+    DEFAULT_CSS = """
+    LatencyPanel {
+        display: none;
+        height: auto;
+        padding: 0 2;
+    }
+    """
+
+    def __init__(self, monitor, **kwargs):
+        super().__init__(**kwargs)
+        self.monitor = monitor
+        self.audio_monitor = None
+
+    def on_mount(self):
+        self.set_interval(0.5, self.update_stats)
+
+    def update_stats(self):
+        if not self.display:
+            return
+        text = "Latency   " + "   ".join(
+            "{}: p50 {:.1f}ms p99 {:.1f}ms".format(stage, p50 / 1000, p99 / 1000)
+            for stage, (p50, p99) in self.monitor.summary().items()
+        )
+        if self.audio_monitor is not None:
+            text += "\n" + self.audio_monitor.describe()
+        self.update(text)
+
+    def toggle(self):
+        self.display = not self.display
+        self.update_stats()